@@ -0,0 +1,33 @@
+from typing import Optional, Iterable
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.models import UserORM
+from app.services.passwords import hash_password
+
+
+class UserRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_by_email(self, email: str) -> Optional[UserORM]:
+        user_find = select(UserORM).where(func.lower(UserORM.email) == email.strip().lower())
+        return self.db.execute(user_find).scalar_one_or_none()
+
+    def create_user(self, email: str, username: str, password_hash: str) -> UserORM:
+        user = UserORM(email=email.strip().lower(), username=username, password_hash=password_hash)
+        self.db.add(user)
+        self.db.flush()
+        return user
+
+    def set_password_hash(self, user: UserORM, password_hash: str) -> UserORM:
+        user.password_hash = password_hash
+        self.db.flush()
+        return user
+
+    def seed_users(self, users: Iterable[dict]) -> None:
+        # Crea els usuaris que encara no existeixen (només per a desenvolupament)
+        for user in users:
+            if self.get_by_email(user['email']) is None:
+                self.create_user(user['email'], user['username'], hash_password(user['password']))
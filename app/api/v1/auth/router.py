@@ -1,11 +1,17 @@
-from datetime import timedelta
+from datetime import timedelta, datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.orm import Session
 from .schemas import Token, UserPublic
-from app.core.security import create_access_token, get_current_user
+from .repository import UserRepository
+from app.core.db import get_db, run_db
+from app.core.security import create_access_token, decode_token, get_current_user, oauth2_scheme, token_cache
+from app.services.revocation import revoke
+from app.services.passwords import (hash_password_async, verify_password_async, needs_rehash, DUMMY_HASH)
 
-FAKE_USERS = {
+# Usuaris de demostració: es creen a la base de dades en arrencar només si AUTH_SEED_DEMO_USERS=true (desenvolupament)
+DEMO_USERS = {
     "ricardo@example.com": {"email": "ricardo@example.com", "username": "ricardo", "password": "secret123"},
     "alumno@example.com":  {"email": "alumno@example.com",  "username": "alumno",  "password": "123456"},
 }
@@ -13,12 +19,28 @@ FAKE_USERS = {
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 @router.post('/login', response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = FAKE_USERS.get(form_data.username)
-    if not user or user['password'] != form_data.password:
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_db(db, lambda session: UserRepository(session).get_by_email(form_data.username))
+    active = user is not None and user.is_active
+    # Sempre es verifica un hash (el de referència si l'usuari no existeix) perquè el temps sigui el mateix
+    valid = await verify_password_async(form_data.password, user.password_hash if active else DUMMY_HASH)
+    if not active or not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
+    # El commit del rehash expira l'objecte: el token es construeix amb valors ja llegits
+    email, username = user.email, user.username
+
+    if needs_rehash(user.password_hash):
+        # Paràmetres de hash canviats: s'actualitza aprofitant que tenim la contrasenya en clar
+        password_hash = await hash_password_async(form_data.password)
+
+        def rehash(session: Session):
+            UserRepository(session).set_password_hash(user, password_hash)
+            session.commit()
+
+        await run_db(db, rehash)
+
     token = create_access_token(
-        data={"sub": user["email"], "username": user["username"]},
+        data={"sub": email, "username": username},
         expires_delta=timedelta(minutes=30),
     )
     return {"access_token": token, "token_type": "bearer"}
@@ -26,3 +48,18 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 @router.get('/me', response_model = UserPublic)
 async def read_me(current = Depends(get_current_user)):
     return {'email': current['email'], 'username': current['username']}
+
+@router.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: str = Depends(oauth2_scheme), current = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Revoca el token actual fins al seu 'exp' (els tokens antics sense jti caduquen sols)
+    payload = decode_token(token)
+    if payload.get('jti'):
+        expires_at = datetime.fromtimestamp(payload['exp'], tz=timezone.utc).replace(tzinfo=None)
+
+        def revoke_token(session: Session):
+            revoke(session, payload['jti'], expires_at)
+            session.commit()
+
+        await run_db(db, revoke_token)
+    token_cache.discard(token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,49 @@
+import os
+from typing import Literal, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from app.services.file_storage import MEDIA_DIR
+from app.services.image_derivatives import derivatives, IMAGE_WIDTHS
+from app.services.media_server import media_server
+
+router = APIRouter(prefix='/media', tags=['media'])
+MEDIA_ROOT = os.path.realpath(MEDIA_DIR)
+# Amb ?w= però sense poder generar la variant es serveix l'original: no es pot marcar immutable
+FALLBACK_CACHE_CONTROL = 'public, max-age=3600'
+
+def resolve_media(name: str) -> str:
+    # Camí dins de MEDIA_DIR (sense sortir-ne amb '..' ni enllaços)
+    path = os.path.realpath(os.path.join(MEDIA_ROOT, name))
+    if os.path.commonpath([MEDIA_ROOT, path]) != MEDIA_ROOT:
+        raise HTTPException(status_code=404, detail='Fitxer no trobat')
+    return path
+
+def locate_media(name: str) -> Tuple[str, os.stat_result]:
+    # realpath i stat toquen el disc: es fan junts en un sol salt al threadpool
+    path = resolve_media(name)
+    return path, os.stat(path)
+
+@router.api_route('/{name:path}', methods=['GET', 'HEAD'], response_class=FileResponse)
+async def get_media(
+        request: Request,
+        name: str,
+        w: Optional[int] = Query(None, ge=1, le=4096, description="Amplada màxima (s'arrodoneix a una de les permeses)"),
+        fmt: Optional[Literal['webp', 'jpeg', 'png']] = Query(None, alias='format'),
+):
+    try:
+        path, stat = await run_in_threadpool(locate_media, name)
+        if w is None and fmt is None:
+            return await media_server.respond(request, path, stat=stat)
+        if not derivatives.available:
+            return await media_server.respond(request, path, cache_control=FALLBACK_CACHE_CONTROL, stat=stat)
+        try:
+            variant, _ = await derivatives.get(path, w or IMAGE_WIDTHS[-1], fmt)
+        except Exception:
+            # Imatge que no es pot processar: millor l'original que un error
+            return await media_server.respond(request, path, cache_control=FALLBACK_CACHE_CONTROL, stat=stat)
+        return await media_server.respond(request, variant)
+    except (FileNotFoundError, IsADirectoryError):
+        raise HTTPException(status_code=404, detail='Fitxer no trobat')
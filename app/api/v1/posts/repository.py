@@ -1,47 +1,79 @@
-from sqlalchemy import select, func
-from sqlalchemy.orm import Session, selectinload, joinedload
-from typing import Optional, Tuple, List
-from app.models import PostORM, AuthorORM, TagORM
-
-from math import ceil
+from sqlalchemy import select, func, insert
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session, selectinload, joinedload, load_only, lazyload
+from collections import Counter
+from datetime import datetime
+from typing import Optional, List, Type, Iterator
+from pydantic import BaseModel
+from app.models import PostORM, AuthorORM, TagORM, post_tags
+from app.services.pagination import Paginator, Page
+from app.services.full_text import apply_full_text
+from app.services.counting import mark_dirty
+from app.services.response_cache import invalidate_on_commit
+from app.services.leaderboard import record_usage, utcnow
+from app.services.tag_index import index_on_commit
 
 
 class PostRepository:
     def __init__(self, db: Session):
         self.db = db
 
-    def get(self, post_id: int) -> Optional[PostORM]:
-        post_find = select(PostORM).where(PostORM.id == post_id)
+    @staticmethod
+    def projection(schema: Optional[Type[BaseModel]]) -> list:
+        # Opcions de càrrega que només porten les columnes i relacions que necessita l'esquema de resposta
+        if schema is None:
+            return []
+        fields = set(schema.model_fields)
+        columns = [getattr(PostORM, name) for name in fields if name in PostORM.__table__.c]
+        options = [load_only(*columns)]
+        for relation in ('tags', 'author'):
+            attr = getattr(PostORM, relation)
+            options.append(selectinload(attr) if relation in fields else lazyload(attr))
+        return options
+
+    def get(self, post_id: int, schema: Optional[Type[BaseModel]] = None) -> Optional[PostORM]:
+        post_find = select(PostORM).options(*self.projection(schema)).where(PostORM.id == post_id)
         return self.db.execute(post_find).scalar_one_or_none()
 
+    @staticmethod
+    def sortable(rank=None) -> dict:
+        # Columnes ordenables; sense cerca de text complet, 'relevance' equival a 'id'
+        return {
+            'id': PostORM.id,
+            'title': func.lower(PostORM.title),
+            'relevance': rank if rank is not None else PostORM.id,
+        }
+
     def search(self,
                query: Optional[str],
-               order_by: str,
-               page: int,
-               direction: str,
-               per_page: int
-    ) -> Tuple[int, List[PostORM]]:
-
-            results = select(PostORM)
-
-            if query:
-                results = results.where(PostORM.title.like(f'%{query}%'))
-            total = self.db.scalar(select(func.count()).select_from(results.subquery())) or 0
-
-            if total == 0:
-                return 0, []
-
-            current_page = min(page, max(1, ceil(total / per_page)))
-            order_col = PostORM.id if order_by == 'id' else func.lower(PostORM.title)
-
-            results = results.order_by(order_col.asc() if direction == 'asc' else order_col.desc())
-
-            # results = sorted(results, key=lambda post: post[order_by], reverse=(direction == 'desc'))
-
-            start = (current_page - 1) * per_page
-            items = self.db.execute(results.limit(per_page).offset(start)).scalars().all()
-
-            return total, list(items)
+               order_by: str = 'id',
+               direction: str = 'asc',
+               per_page: int = 10,
+               page: int = 1,
+               cursor: Optional[str] = None,
+               strategy: str = 'offset',
+               count_mode: str = 'exact',
+               schema: Optional[Type[BaseModel]] = None,
+    ) -> Page:
+        results = select(PostORM).options(*self.projection(schema))
+        rank = None
+
+        if query:
+            results, rank = apply_full_text(self.db, results, query)
+
+        # 'asc' en rellevància vol dir primer els més rellevants (rank més petit)
+        paginator = Paginator(self.db, PostORM, self.sortable(rank))
+        return paginator.paginate(
+            results,
+            strategy=strategy,
+            per_page=per_page,
+            order_by=order_by,
+            direction=direction,
+            page=page,
+            cursor=cursor,
+            count_key=query.strip().lower() if query else '',
+            count_mode=count_mode,
+        )
 
     def by_tags(self, tags: List[str]) -> List[PostORM]:
         normalized_tag_names = [tag.strip().lower() for tag in tags if tag.strip()]
@@ -60,6 +92,54 @@ class PostRepository:
 
         return list(self.db.execute(post_list).scalars().all())
 
+    def export_chunks(self,
+                      chunk_size: int,
+                      tag: Optional[str] = None,
+                      author_email: Optional[str] = None,
+                      since: Optional[datetime] = None,
+                      until: Optional[datetime] = None,
+                      after_id: int = 0,
+    ) -> Iterator[List[PostORM]]:
+        # Recorre la taula per blocs de mida fixa ordenats per id (id > últim id llegit).
+        # Cada bloc és una consulta curta i es treu de la sessió abans de llegir el següent,
+        # de manera que la memòria no creix amb la mida de la taula.
+        results = select(PostORM).options(selectinload(PostORM.tags), joinedload(PostORM.author))
+        if tag:
+            results = results.where(PostORM.tags.any(func.lower(TagORM.name) == tag.strip().lower()))
+        if author_email:
+            results = results.where(PostORM.author.has(AuthorORM.email == author_email))
+        if since:
+            results = results.where(PostORM.created_at >= since)
+        if until:
+            results = results.where(PostORM.created_at < until)
+
+        last_id = after_id
+        while True:
+            chunk = list(self.db.execute(
+                results.where(PostORM.id > last_id).order_by(PostORM.id.asc()).limit(chunk_size)
+            ).unique().scalars().all())
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
+            self.db.expunge_all()
+            if len(chunk) < chunk_size:
+                return
+
+    def _insert_ignore_stmt(self, model, conflict_column: str):
+        # INSERT ... ON CONFLICT DO NOTHING: si un altre procés ja ha creat la fila, no hi ha IntegrityError
+        dialect = self.db.get_bind().dialect.name
+        if dialect == 'sqlite':
+            return sqlite.insert(model).on_conflict_do_nothing(index_elements=[conflict_column])
+        if dialect == 'postgresql':
+            return postgresql.insert(model).on_conflict_do_nothing(index_elements=[conflict_column])
+        return insert(model)
+
+    def _insert_ignore(self, model, rows: List[dict], conflict_column: str) -> None:
+        if not rows:
+            return
+        self.db.execute(self._insert_ignore_stmt(model, conflict_column), rows)
+
     def ensure_author(self, name: str, email: str) -> AuthorORM:
 
         author_obj = self.db.execute(
@@ -69,30 +149,45 @@ class PostRepository:
         if author_obj:
             return author_obj
 
-        author_obj = AuthorORM(name=name, email=email)
-        self.db.add(author_obj)
-        self.db.flush()
-        return author_obj
+        self._insert_ignore(AuthorORM, [{'name': name, 'email': email}], 'email')
+        return self.db.execute(
+            select(AuthorORM).where(AuthorORM.email == email)
+        ).scalar_one()
 
     def ensure_tag(self, name: str) -> TagORM:
-        normalize = name.strip().lower()
+        return self.ensure_tags([name])[0]
 
-        # implementació per operar amb postgreSQL
-        # tag_obj = self.db.execute(
-        #     select(TagORM).where(TagORM.name.ilike(name))
-        # ).scalar_one_or_none()
+    def ensure_tags(self, names: List[str]) -> List[TagORM]:
+        # Resolució de totes les etiquetes en bloc: un SELECT ... IN, un INSERT multi-fila
+        # per a les que falten i un últim SELECT només per a les noves.
+        normalized = list(dict.fromkeys(name.strip().lower() for name in names if name.strip()))
+        if not normalized:
+            return []
 
-        # implementació per operar amb SQLite
-        tag_obj = self.db.execute(
-            select(TagORM).where(func.lower(TagORM.name) == normalize)
-        ).scalar_one_or_none()
-        if tag_obj:
-            return tag_obj
-
-        tag_obj = TagORM(name=name)
-        self.db.add(tag_obj)
-        self.db.flush()
-        return tag_obj
+        # implementació per operar amb SQLite (amb PostgreSQL es podria fer servir ilike)
+        found = {
+            tag.name.lower(): tag
+            for tag in self.db.execute(
+                select(TagORM).where(func.lower(TagORM.name).in_(normalized))
+            ).scalars()
+        }
+
+        missing = [name for name in normalized if name not in found]
+        if missing:
+            self._insert_ignore(TagORM, [{'name': name} for name in missing], 'name')
+            for tag in self.db.execute(
+                select(TagORM).where(func.lower(TagORM.name).in_(missing))
+            ).scalars():
+                found[tag.name.lower()] = tag
+                index_on_commit(self.db, 'upsert', tag.id, tag.name)
+
+        return [found[name] for name in normalized if name in found]
+
+    def _track_usage(self, tag_ids: List[int], created_at: Optional[datetime], delta: int = 1) -> None:
+        # Comptadors d'ús: rànquing per finestres i índex d'autocompletat
+        record_usage(self.db, tag_ids, created_at, delta)
+        for tag_id, uses in Counter(tag_ids).items():
+            index_on_commit(self.db, 'add_uses', tag_id, uses * delta)
 
     def create_post(self, title: str, content: str, author: Optional[dict], tags: Optional[List[dict]], image_url: str) -> PostORM:
         author_obj = None
@@ -101,22 +196,84 @@ class PostRepository:
 
         post = PostORM(title=title, content=content, image_url=image_url, author=author_obj)
 
-        names = tags[0]['name'].split(',')
-        for name in names:
-            name = name.strip().lower()
-            if not name:
-                continue
-            tag_obj = self.ensure_tag(name)
-            post.tags.append(tag_obj)
+        # Cada camp 'tags' pot portar diversos noms separats per comes
+        names = [name for tag in (tags or []) for name in tag['name'].split(',')]
+        post.tags.extend(self.ensure_tags(names))
 
         self.db.add(post)
         self.db.flush()
         self.db.refresh(post)
+        self._track_usage([tag.id for tag in post.tags], post.created_at)
+        mark_dirty(self.db, 'posts', 'tags')
+        invalidate_on_commit(self.db, 'posts:list')
         return post
 
+    def bulk_create_posts(self, posts: List[dict], author: Optional[dict]) -> List[Optional[int]]:
+        # Inserció massiva: autor i etiquetes es resolen un sol cop per a tot el lot, els posts
+        # s'insereixen amb un INSERT multi-fila i els enllaços post_tags amb un altre.
+        # Retorna l'id de cada post en el mateix ordre, o None si el títol ja existia.
+        if not posts:
+            return []
+
+        # Els títols repetits (dins del lot o ja desats) es descarten abans de crear res:
+        # les seves etiquetes no s'han de crear
+        existing = set(self.db.execute(
+            select(PostORM.title).where(PostORM.title.in_({post['title'] for post in posts}))
+        ).scalars())
+        created_at = utcnow()
+        rows = {}
+        for post in posts:
+            # Dins del lot només s'insereix la primera aparició de cada títol
+            if post['title'] not in existing and post['title'] not in rows:
+                rows[post['title']] = post
+        if not rows:
+            return [None] * len(posts)
+
+        author_id = None
+        if author:
+            author_id = self.ensure_author(author['username'], author['email']).id
+
+        tag_ids = {
+            tag.name.lower(): tag.id
+            for tag in self.ensure_tags([name for post in rows.values() for name in post.get('tags', [])])
+        }
+
+        # ON CONFLICT encara cobreix un títol desat per una altra transacció després del SELECT
+        inserted = self.db.execute(
+            self._insert_ignore_stmt(PostORM, 'title').returning(PostORM.id, PostORM.title),
+            [{
+                'title': post['title'],
+                'content': post['content'],
+                'image_url': post.get('image_url'),
+                'author_id': author_id,
+                'created_at': created_at,
+            } for post in rows.values()],
+        ).all()
+        ids_by_title = {title: post_id for post_id, title in inserted}
+
+        links = []
+        results: List[Optional[int]] = []
+        for post in posts:
+            post_id = ids_by_title.pop(post['title'], None)
+            results.append(post_id)
+            if post_id is None:
+                continue
+            names = dict.fromkeys(name.strip().lower() for name in post.get('tags', []) if name.strip())
+            links.extend({'post_id': post_id, 'tag_id': tag_ids[name]} for name in names if name in tag_ids)
+
+        if links:
+            self.db.execute(insert(post_tags), links)
+            self._track_usage([link['tag_id'] for link in links], created_at)
+
+        mark_dirty(self.db, 'posts', 'tags')
+        invalidate_on_commit(self.db, 'posts:list')
+        return results
+
     def update_post(self, post: PostORM, updates: dict) -> PostORM:
         for key, value in updates.items():
             setattr(post, key, value)
+        mark_dirty(self.db, 'posts')
+        invalidate_on_commit(self.db, f'post:{post.id}', 'posts:list:sorted')
 
         # self.db.add(post)
         # self.db.refresh(post)
@@ -124,5 +281,8 @@ class PostRepository:
 
 
     def delete_post(self, post: PostORM) -> None:
+        self._track_usage([tag.id for tag in post.tags], post.created_at, delta=-1)
         self.db.delete(post)
+        mark_dirty(self.db, 'posts')
+        invalidate_on_commit(self.db, f'post:{post.id}', 'posts:list')
 
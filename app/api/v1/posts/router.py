@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Query, Depends, Path, HTTPException, status, UploadFile, File
+import os
+import zlib
+from datetime import datetime
+from fastapi import APIRouter, Query, Depends, Path, HTTPException, status, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from typing import List, Optional, Union, Literal, Annotated
-from math import ceil
-from app.core.db import get_db
-from .schemas import (PostPublic, PostSummary, PaginatedPosts, PostCreate, PostUpdate)
+from typing import List, Optional, Union, Literal, Annotated, AsyncIterator
+from app.core.db import get_db, run_db, SessionLocal
+from .schemas import (PostPublic, PostSummary, PaginatedPosts, PaginatedPostSummaries, PostCreate, PostUpdate,
+                      BulkCreateResult, BulkItemResult, PostExport)
 from .repository import PostRepository
 from app.core.security import oauth2_scheme, get_current_user
 from app.services.file_storage import save_upload_file
+from app.services.media_blobs import release
+from app.services.response_cache import cached_json
+from app.services.serialization import FastJSONResponse, dump_json
 
 # importacions per treballar amb funcions syncrones i asyncrones
 # import time
@@ -15,6 +24,9 @@ from app.services.file_storage import save_upload_file
 # import threading
 
 router = APIRouter(prefix="/posts", tags=['posts'])
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '500'))
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '500'))
 
 # def get_fake_user():
 #     return {'username':'Eduard', 'role': 'Admin'}
@@ -38,8 +50,9 @@ router = APIRouter(prefix="/posts", tags=['posts'])
 #     return {'Message': 'Funció asyncrona finalitza'}
 #
 
-@router.get('', response_model=PaginatedPosts)
-def list_posts(
+@router.get('', response_model=Union[PaginatedPosts, PaginatedPostSummaries])
+async def list_posts(
+    request: Request,
     text: Optional[str] = Query(
         default = None,
         deprecated=True,
@@ -47,7 +60,7 @@ def list_posts(
 ),
     query: Optional[str] = Query(
         default = None,
-        description = 'Buscar per títol',
+        description = 'Cerca de text complet per títol i contingut',
         alias='search',
         min_length=3,
         max_length=50,
@@ -61,118 +74,291 @@ def list_posts(
         1, ge=1,
         description='Número de pàgina (>=1)'
     ),
-    order_by: Literal['id', 'title'] = Query(
-        'id', description='Camp ordenació'
+    order_by: Literal['id', 'title', 'relevance'] = Query(
+        'id', description='Camp ordenació ("relevance" només amb "search")'
     ),
     direction: Literal['desc', 'asc'] = Query(
         'asc', description='Ordenació ascendent'
     ),
+    pagination: Literal['offset', 'cursor'] = Query(
+        'offset', description='Tipus de paginació: per número de pàgina o per cursor'
+    ),
+    cursor: Optional[str] = Query(
+        default=None,
+        description='Cursor opac retornat a "next_cursor" o "prev_cursor" (implica pagination=cursor)'
+    ),
+    count: Literal['exact', 'estimate', 'none'] = Query(
+        'exact', description='Recompte del total: exacte (en memòria cau), estimat per a taules grans o cap (només has_next)'
+    ),
+    include_content: bool = Query(
+        default=True, description='Incloure o no el contingut (si és fals només es carreguen id i títol)'
+    ),
     db: Session = Depends(get_db),
 ):
-    repository = PostRepository(db)
     query = query or text
-    total, items = repository.search(query, order_by, page, direction, per_page)
-    total_pages = ceil(total / per_page) if total > 0 else 0
-    current_page = 1 if total_pages == 0 else min(page, total_pages)
-
-    has_prev = current_page > 1
-    has_next = current_page < total_pages if total > 0 else False
-
-    return PaginatedPosts(
-        page=current_page,
-        per_page=per_page,
-        total=total,
-        total_pages=total_pages,
-        has_prev=has_prev,
-        has_next=has_next,
-        order_by=order_by,
-        direction=direction,
-        search=query,
-        items=items
-    )
-@router.get('/by_tags', response_model=List[PostPublic])
-def filter_posts_by_tags(tags: List[str] = Query(
+
+    if pagination == 'cursor' or cursor:
+        strategy = 'keyset'
+    else:
+        strategy = 'has_more' if count == 'none' else 'offset'
+    if strategy == 'keyset' and order_by == 'relevance':
+        raise HTTPException(status_code=400, detail='La paginació per cursor només admet order_by=id o title')
+
+    def build_page(session: Session):
+        repository = PostRepository(session)
+        item_schema = PostPublic if include_content else PostSummary
+        try:
+            result = repository.search(
+                query, order_by, direction, per_page, page=page, cursor=cursor, strategy=strategy,
+                count_mode=count, schema=item_schema,
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Cursor invàlid')
+
+        page_schema = PaginatedPosts if include_content else PaginatedPostSummaries
+        return dump_json(page_schema, result.envelope(search=query)), [item.id for item in result.items]
+
+    async def build():
+        body, post_ids = await run_db(db, build_page)
+        # Les llistes ordenades per títol o filtrades per cerca depenen del títol/contingut de qualsevol post
+        groups = ['posts:list'] + [f'post:{post_id}' for post_id in post_ids]
+        if query or order_by != 'id':
+            groups.append('posts:list:sorted')
+        return body, groups
+
+    key = 'posts:list?' + '&'.join(sorted(f'{name}={value}' for name, value in request.query_params.multi_items()))
+    return await cached_json(request, key, build)
+
+@router.get('/by_tags', response_model=List[PostPublic], response_class=FastJSONResponse)
+async def filter_posts_by_tags(tags: List[str] = Query(
             ..., min_length=1, description='Filter por tags. Example: ?tags=python&tags=fastapi'), db: Session = Depends(get_db)
 ):
-    repository = PostRepository(db)
-    return repository.by_tags(tags)
+    def find(session: Session):
+        repository = PostRepository(session)
+        return dump_json(List[PostPublic], repository.by_tags(tags))
+
+    return FastJSONResponse(await run_db(db, find))
+
+@router.get('/export', response_class=StreamingResponse, response_description='Posts en format NDJSON')
+def export_posts(
+        tag: Optional[str] = Query(None, description='Només posts amb aquesta etiqueta'),
+        author: Optional[str] = Query(None, description='Només posts d\'aquest autor (email)'),
+        since: Optional[datetime] = Query(None, description='Creats a partir d\'aquesta data'),
+        until: Optional[datetime] = Query(None, description='Creats abans d\'aquesta data'),
+        after_id: int = Query(0, ge=0, description='Reprendre l\'exportació després d\'aquest id'),
+        chunk_size: int = Query(EXPORT_CHUNK_SIZE, ge=1, le=5000, description='Posts per consulta'),
+        compress: bool = Query(False, alias='gzip', description='Comprimir la resposta amb gzip'),
+):
+    def lines():
+        # La sessió és pròpia del generador: ha de viure mentre s'envia la resposta
+        db = SessionLocal()
+        db.info['read_only'] = True
+        try:
+            repository = PostRepository(db)
+            for chunk in repository.export_chunks(chunk_size, tag, author, since, until, after_id):
+                yield b''.join(
+                    dump_json(PostExport, post) + b'\n' for post in chunk
+                )
+        finally:
+            db.close()
+
+    def gzipped():
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        for data in lines():
+            block = compressor.compress(data)
+            if block:
+                yield block
+        yield compressor.flush()
+
+    headers = {'Content-Disposition': 'attachment; filename="posts.ndjson"'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(gzipped() if compress else lines(), media_type='application/x-ndjson', headers=headers)
 
 @router.get('/{post_id}', response_model=Union[PostPublic, PostSummary], response_description='Entrada trobada')
-def get_post(post_id: int = Path(
+async def get_post(request: Request, post_id: int = Path(
     ...,
     ge=1,
     title='ID del post',
     description='Identificador del Post. Ha de ser més gran de 1',
     examples= [1]
 ), include_content: bool = Query(default = True, description = 'Incloure o no el contingut'), db: Session = Depends(get_db)):
-    repository = PostRepository(db)
-    post = repository.get(post_id)
+    def find(session: Session):
+        repository = PostRepository(session)
+        schema = PostPublic if include_content else PostSummary
+        post = repository.get(post_id, schema)
+
+        if not post:
+            raise HTTPException(status_code=404, detail='Entrada no trobada')
+        return dump_json(schema, post)
 
-    if not post:
-        raise HTTPException(status_code=404, detail='Entrada no trobada')
-    if include_content:
-        return PostPublic.model_validate(post, from_attributes=True)
-    return PostSummary.model_validate(post, from_attributes=True)
+    async def build():
+        return await run_db(db, find), [f'post:{post_id}']
+
+    return await cached_json(request, f'post:{post_id}?include_content={include_content}', build)
 
 @router.post('', response_model=PostPublic, response_description='Entrada creada correctament',
           status_code=status.HTTP_201_CREATED)
-def create_post(post: Annotated[PostCreate, Depends(PostCreate.as_form)], image: Optional[UploadFile] = File(None), db: Session = Depends(get_db), user = Depends(get_current_user)):
-    repository = PostRepository(db)
+async def create_post(post: Annotated[PostCreate, Depends(PostCreate.as_form)], image: Optional[UploadFile] = File(None), db: Session = Depends(get_db), user = Depends(get_current_user)):
     saved = None
+    if image is not None:
+        saved = await run_in_threadpool(save_upload_file, image)
+    image_url = saved['url'] if saved else None
+
+    def create(session: Session):
+        repository = PostRepository(session)
+        try:
+            created = repository.create_post(
+                title=post.title,
+                content=post.content,
+                author = user,
+                tags = [tag.model_dump() for tag in post.tags],
+                image_url = image_url,
+            )
+            session.commit()
+            session.refresh(created)
+            return PostPublic.model_validate(created)
+        except IntegrityError:
+            session.rollback()
+            # Les etiquetes es creen amb ON CONFLICT DO NOTHING: l'únic conflicte possible és el títol
+            raise HTTPException(status_code=409, detail='Ja existeix un post amb aquest títol')
+        except SQLAlchemyError:
+            session.rollback()
+            raise HTTPException(status_code=500, detail='Error al crear post')
+
+    try:
+        return await run_db(db, create)
+    finally:
+        # Amb el post desat la imatge ja té la seva referència (refcount); si no s'ha pogut crear,
+        # queda lliure perquè el sweeper la reculli. Només les pujades soltes (/upload) queden retingudes.
+        if image_url:
+            await run_in_threadpool(release, image_url)
+
+async def _bulk_payloads(request: Request) -> AsyncIterator:
+    # NDJSON es llegeix línia a línia a mesura que arriba; un array JSON s'ha de llegir sencer
+    if request.headers.get('content-type', '').split(';')[0].strip() in NDJSON_TYPES:
+        buffer = b''
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+        return
+
     try:
-        if image is not None:
-            saved = save_upload_file(image)
-        image_url = saved['url'] if saved else None
-        post = repository.create_post(
-            title=post.title,
-            content=post.content,
-            author = user,
-            tags = [tag.model_dump() for tag in post.tags],
-            image_url = image_url,
-        )
-        db.commit()
-        db.refresh(post)
-        return post
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=409, detail='Nom etiqueta ja existeix')
-    except SQLAlchemyError:
-        db.rollback()
-        raise HTTPException(status_code=500, detail='Error al crear post')
+        payloads = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Cos JSON invàlid')
+    if not isinstance(payloads, list):
+        raise HTTPException(status_code=400, detail='S\'esperava un array JSON o NDJSON')
+    for payload in payloads:
+        yield payload
+
+@router.post('/bulk', response_model=BulkCreateResult, response_class=FastJSONResponse,
+             response_description='Resultat per a cada entrada')
+async def bulk_create_posts(
+        request: Request,
+        batch_size: int = Query(BULK_BATCH_SIZE, ge=1, le=5000, description='Posts per lot (una transacció per lot)'),
+        db: Session = Depends(get_db),
+        user = Depends(get_current_user),
+):
+    results: List[BulkItemResult] = []
+    batch: List[tuple] = []
+
+    def flush_batch(session: Session, pending: List[tuple]) -> List[BulkItemResult]:
+        repository = PostRepository(session)
+        try:
+            ids = repository.bulk_create_posts([post for _, post in pending], author=user)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            if len(pending) == 1:
+                return [BulkItemResult(index=pending[0][0], status='error', detail='Error al crear post')]
+            # Una fila dolenta no ha de fer fallar tot el lot: es parteix per la meitat fins a aïllar-la
+            middle = len(pending) // 2
+            return flush_batch(session, pending[:middle]) + flush_batch(session, pending[middle:])
+        return [
+            BulkItemResult(index=index, status='created', id=post_id) if post_id is not None
+            else BulkItemResult(index=index, status='error', detail='Ja existeix un post amb aquest títol')
+            for (index, _), post_id in zip(pending, ids)
+        ]
+
+    index = 0
+    async for payload in _bulk_payloads(request):
+        try:
+            if isinstance(payload, bytes):
+                post = PostCreate.model_validate_json(payload)
+            else:
+                post = PostCreate.model_validate(payload)
+        except ValidationError as exc:
+            detail = '; '.join(
+                f"{'.'.join(str(loc) for loc in error['loc']) or 'body'}: {error['msg']}" for error in exc.errors()
+            )
+            results.append(BulkItemResult(index=index, status='error', detail=detail))
+        else:
+            if post.content is None:
+                # PostCreate l'accepta (és opcional) però la columna és NOT NULL
+                results.append(BulkItemResult(index=index, status='error', detail='content: no pot ser null'))
+            else:
+                batch.append((index, {
+                    'title': post.title,
+                    'content': post.content,
+                    'tags': [name for tag in post.tags for name in tag.name.split(',')],
+                }))
+                if len(batch) >= batch_size:
+                    results.extend(await run_db(db, flush_batch, batch))
+                    batch = []
+        index += 1
+
+    if batch:
+        results.extend(await run_db(db, flush_batch, batch))
+
+    results.sort(key=lambda item: item.index)
+    created = sum(1 for item in results if item.status == 'created')
+    return FastJSONResponse(dump_json(BulkCreateResult, dict(created=created, failed=len(results) - created, items=results)))
 
 @router.put('/{post_id}',
             response_model=PostPublic,
             response_description='Entrada creada correctament',
             response_model_exclude_none=True)
 
-def update_post(post_id: int, data: PostUpdate, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    repository = PostRepository(db)
-    post = repository.get(post_id)
+async def update_post(post_id: int, data: PostUpdate, db: Session = Depends(get_db), user = Depends(get_current_user)):
+    def update(session: Session):
+        repository = PostRepository(session)
+        post = repository.get(post_id)
 
-    if not post:
-        raise HTTPException(status_code=404, detail='Entrada no existeix')
-    try:
-        updates = data.model_dump(exclude_none=True)
-        post = repository.update_post(post, updates)
-        db.commit()
-        db.refresh(post)
-        return post
-    except SQLAlchemyError:
-        db.rollback()
-        raise HTTPException(status_code=500, detail='Error al actualitzar el post')
+        if not post:
+            raise HTTPException(status_code=404, detail='Entrada no existeix')
+        try:
+            updates = data.model_dump(exclude_none=True)
+            post = repository.update_post(post, updates)
+            session.commit()
+            session.refresh(post)
+            return PostPublic.model_validate(post)
+        except SQLAlchemyError:
+            session.rollback()
+            raise HTTPException(status_code=500, detail='Error al actualitzar el post')
+
+    return await run_db(db, update)
 
 @router.delete('/{post_id}',status_code=status.HTTP_204_NO_CONTENT   )
-def delete_post(post_id: int, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    repository = PostRepository(db)
-    post = repository.get(post_id)
-    if not post:
-        raise HTTPException(status_code=404, detail='Entrada no existeix')
-    try:
-        repository.delete_post(post)
-        db.commit()
-    except SQLAlchemyError:
-        db.rollback()
-        raise HTTPException(status_code=500, detail='Error al eliminar el post')
+async def delete_post(post_id: int, db: Session = Depends(get_db), user = Depends(get_current_user)):
+    def delete(session: Session):
+        repository = PostRepository(session)
+        post = repository.get(post_id)
+        if not post:
+            raise HTTPException(status_code=404, detail='Entrada no existeix')
+        try:
+            repository.delete_post(post)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise HTTPException(status_code=500, detail='Error al eliminar el post')
+
+    await run_db(db, delete)
 
 @router.get('/secure')
 def secure_endpoint(token: str = Depends(oauth2_scheme)):
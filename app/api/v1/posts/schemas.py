@@ -1,6 +1,17 @@
+from datetime import datetime
+from functools import lru_cache
 from typing import Optional, List, Union, Literal, Annotated
-from pydantic import BaseModel, Field, field_validator, EmailStr, ConfigDict
+from pydantic import BaseModel, Field, field_validator, ConfigDict, AfterValidator, WithJsonSchema
+from pydantic.networks import validate_email
 from fastapi import Form
+from app.services.pagination import PageEnvelope
+
+@lru_cache(maxsize=4096)
+def _checked_email(value: str) -> str:
+    # Validar un email costa ~90 µs i a les llistes el mateix autor es repeteix a cada post
+    return validate_email(value)[1]
+
+CachedEmailStr = Annotated[str, AfterValidator(_checked_email), WithJsonSchema({'type': 'string', 'format': 'email'})]
 
 class Tag(BaseModel):
     name: str = Field(..., min_length=4, max_length=35, description='Nom de l\'etiqueta')
@@ -8,7 +19,7 @@ class Tag(BaseModel):
 
 class Author(BaseModel):
     name: str
-    email: EmailStr
+    email: CachedEmailStr
     model_config = ConfigDict(from_attributes=True)
 
 class PostBase(BaseModel):
@@ -64,19 +75,29 @@ class PostPublic(PostBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
 
+class PostExport(PostPublic):
+    created_at: datetime
+
 class PostSummary(BaseModel):
     id: int
     title: str
     model_config = ConfigDict(from_attributes=True)
 
-class PaginatedPosts(BaseModel):
-    page: int
-    per_page: int
-    total: int
-    total_pages: int
-    has_prev: bool
-    has_next: bool
-    order_by: Literal['id', 'title']
-    direction: Literal['desc', 'asc']
+class PaginatedPosts(PageEnvelope):
+    order_by: Literal['id', 'title', 'relevance']
     search: Optional[str] = None
     items: List[PostPublic]
+
+class PaginatedPostSummaries(PaginatedPosts):
+    items: List[PostSummary]
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: Literal['created', 'error']
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BulkCreateResult(BaseModel):
+    created: int
+    failed: int
+    items: List[BulkItemResult]
@@ -1,11 +1,14 @@
-from typing import Optional
+from typing import Optional, List
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy import select, func, delete
 
-from app.api.v1.tags.schemas import TagPublic
-from app.models import TagORM, PostORM, post_tags
-from app.services.pagination import paginate_query
+from app.models import TagORM, post_tags
+from app.services.pagination import Paginator, Page
+from app.services.counting import mark_dirty
+from app.services.response_cache import invalidate_on_commit
+from app.services.leaderboard import leaderboard, forget_tag, reset_on_commit
+from app.services.tag_index import index_on_commit
 
 
 class TagRepository:
@@ -23,26 +26,29 @@ class TagRepository:
             direction: str = 'asc',
             page: int = 1,
             per_page: int = 10,
-    ):
+            count_mode: str = 'exact',
+            cursor: Optional[str] = None,
+            strategy: str = 'offset',
+    ) -> Page:
         query = select(TagORM)
         if search:
             query = query.where(func.lower(TagORM.name).ilike(f'%{search.lower()}%'))
-        allowed_order = {
+        sortable = {
             'id': TagORM.id,
             'name': func.lower(TagORM.name),
+            'post_count': TagORM.post_count,
         }
-        result = paginate_query(
-            db=self.db,
-            model= TagORM,
-            base_query=query,
-            page=page,
+        return Paginator(self.db, TagORM, sortable).paginate(
+            query,
+            strategy=strategy,
             per_page=per_page,
             order_by=order_by,
             direction=direction,
-            allowed_order=allowed_order
+            page=page,
+            cursor=cursor,
+            count_key=search.lower() if search else '',
+            count_mode=count_mode,
         )
-        result['items'] = [TagPublic.model_validate(item) for item in result['items']]
-        return result
 
     def create_tag(self, name: str):
         normalize = name.strip().lower()
@@ -57,8 +63,15 @@ class TagRepository:
         tag_obj = TagORM(name=name)
         self.db.add(tag_obj)
         self.db.flush()
+        mark_dirty(self.db, 'tags')
+        index_on_commit(self.db, 'upsert', tag_obj.id, tag_obj.name)
         return tag_obj
 
+    def _invalidate_tagged_posts(self, tag_id: int) -> None:
+        # Els posts amb aquesta etiqueta la porten incrustada a la resposta
+        post_ids = self.db.execute(select(post_tags.c.post_id).where(post_tags.c.tag_id == tag_id)).scalars().all()
+        invalidate_on_commit(self.db, *(f'post:{post_id}' for post_id in post_ids))
+
     def tag_update(self, tag_id: int, name: str):
         tag = self.get_tag_id(tag_id)
         if not tag:
@@ -69,30 +82,30 @@ class TagRepository:
         self.db.add(tag)
         self.db.flush()
         self.db.refresh(tag)
+        mark_dirty(self.db, 'tags')
+        self._invalidate_tagged_posts(tag.id)
+        index_on_commit(self.db, 'upsert', tag.id, tag.name)
+        reset_on_commit(self.db)
         return tag
 
     def tag_delete(self, tag_id: int) -> bool:
         tag = self.get_tag_id(tag_id)
         if not tag:
             return False
+        self._invalidate_tagged_posts(tag.id)
+        # TagORM.posts no es carrega: els enllaços s'esborren directament (SQLite no aplica ON DELETE CASCADE)
+        self.db.execute(delete(post_tags).where(post_tags.c.tag_id == tag.id))
+        forget_tag(self.db, tag.id)
         self.db.delete(tag)
+        mark_dirty(self.db, 'tags')
+        index_on_commit(self.db, 'remove', tag.id)
         return True
 
+    def popular(self, k: int = 10, window: str = 'all') -> List[dict]:
+        return leaderboard.top(self.db, window, k)
+
     def most_popular(self) -> dict | None:
-        row = (
-            self.db.execute(
-                select(
-                    TagORM.id.label('id'),
-                    TagORM.name.label('name'),
-                    func.count(PostORM.id).label('count'),
-                )
-                .join(post_tags, post_tags.c.tag_id == TagORM.id)
-                .join(PostORM, PostORM.id == post_tags.c.post_id)
-                .group_by(TagORM.id, TagORM.name)
-                .order_by(func.count(PostORM.id).desc(), func.lower(TagORM.name).asc())
-                .limit(1)
-            )
-            .mappings()
-            .first()
-        )
-        return dict(row) if row else None
\ No newline at end of file
+        top = self.popular(k=1)
+        if not top:
+            return None
+        return {'id': top[0]['id'], 'name': top[0]['name'], 'count': top[0]['uses']}
\ No newline at end of file
@@ -1,71 +1,120 @@
+from typing import List, Literal
 from fastapi import APIRouter, status, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.api.v1.tags.schemas import TagPublic, TagCreate, TagUpdate
+from app.api.v1.tags.schemas import TagPublic, TagCreate, TagUpdate, PaginatedTags, PopularTags, TagWithCount
 from app.api.v1.tags.repository import TagRepository
-from app.core.db import get_db
+from app.core.db import get_db, run_db
 from app.core.security import get_current_user
+from app.services.serialization import FastJSONResponse, dump_json
+from app.services.leaderboard import LEADERBOARD_MAX_K
+from app.services.tag_index import tag_index, suggest_from_db, SUGGEST_MAX_K
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
-@router.get('', response_model=dict)
-def list_tags(
+@router.get('', response_model=PaginatedTags, response_class=FastJSONResponse)
+async def list_tags(
         page: int = Query(1, ge=1),
         per_page: int = Query(10, ge=1, le=100),
-        order_by: str = Query('id', pattern="^(id|name)$"),
+        order_by: str = Query('id', pattern="^(id|name|post_count)$"),
         direction: str = Query('asc', pattern="^(asc|desc)$"),
         search: str | None = Query(None),
+        count: str = Query('exact', pattern="^(exact|estimate|none)$"),
+        pagination: Literal['offset', 'cursor'] = Query('offset'),
+        cursor: str | None = Query(None),
         db: Session = Depends(get_db)
 ):
+    if pagination == 'cursor' or cursor:
+        strategy = 'keyset'
+    else:
+        strategy = 'has_more' if count == 'none' else 'offset'
 
-    repository = TagRepository(db)
-    return repository.list_tags(page=page, per_page=per_page, order_by=order_by, direction=direction, search=search)
+    def find(session: Session):
+        repository = TagRepository(session)
+        try:
+            result = repository.list_tags(page=page, per_page=per_page, order_by=order_by, direction=direction,
+                                          search=search, count_mode=count, cursor=cursor, strategy=strategy)
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Cursor invàlid')
+        return dump_json(PaginatedTags, result.envelope(search=search))
+
+    return FastJSONResponse(await run_db(db, find))
+
+@router.get('/popular', response_model=PopularTags, response_class=FastJSONResponse)
+async def popular_tags(
+        k: int = Query(10, ge=1, le=LEADERBOARD_MAX_K, description='Nombre d\'etiquetes del rànquing'),
+        window: Literal['24h', '7d', '30d', 'all'] = Query('all', description='Finestra temporal segons la data dels posts'),
+        db: Session = Depends(get_db),
+):
+    def find(session: Session):
+        items = TagRepository(session).popular(k=k, window=window)
+        return dump_json(PopularTags, {'window': window, 'k': k, 'items': items})
+
+    return FastJSONResponse(await run_db(db, find))
+
+@router.get('/suggest', response_model=List[TagWithCount], response_class=FastJSONResponse)
+async def suggest_tags(
+        prefix: str = Query(..., min_length=1, max_length=35, description='Inici del nom de l\'etiqueta'),
+        k: int = Query(10, ge=1, le=SUGGEST_MAX_K, description='Nombre màxim de suggeriments'),
+        db: Session = Depends(get_db),
+):
+    # Autocompletat: índex en memòria ordenat per ús; mentre l'índex és fred es consulta la base de dades
+    tag_index.refresh()
+    if tag_index.ready:
+        return FastJSONResponse(dump_json(List[TagWithCount], tag_index.suggest(prefix, k)))
+    return FastJSONResponse(await run_db(db, lambda session: dump_json(List[TagWithCount], suggest_from_db(session, prefix, k))))
 
 @router.post('', response_model=TagPublic, response_description='Etiqueta creada', status_code=status.HTTP_201_CREATED)
-def create_tag(tag: TagCreate, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    from app.api.v1.tags.repository import TagRepository
-    repository = TagRepository(db)
+async def create_tag(tag: TagCreate, db: Session = Depends(get_db), user = Depends(get_current_user)):
+    def create(session: Session):
+        repository = TagRepository(session)
+        try:
+            tag_created = repository.create_tag(name=tag.name)
+            session.commit()
+            session.refresh(tag_created)
+            return TagPublic.model_validate(tag_created)
+        except SQLAlchemyError:
+            session.rollback()
+            raise HTTPException(status_code=500, detail='Error al crear l\'etiqueta')
 
-    try:
-        tag_created = repository.create_tag(name=tag.name)
-        db.commit()
-        db.refresh(tag_created)
-        return tag_created
-    except SQLAlchemyError:
-        db.rollback()
-        raise HTTPException(status_code=500, detail='Error al crear l\'etiqueta')
+    return await run_db(db, create)
 
 @router.put('/{tag_id}', response_model = TagPublic)
-def update_tag(
+async def update_tag(
         tag_id: int,
         payload: TagUpdate,
         db: Session = Depends(get_db),
         user = Depends(get_current_user),
 ):
-    repository = TagRepository(db)
-    tag = repository.tag_update(tag_id, name=payload.name)
-    if not tag:
-        raise HTTPException(status_code=404, detail='Etiqueta no existeix')
-    db.commit()
-    return TagPublic.model_validate(tag)
+    def update(session: Session):
+        repository = TagRepository(session)
+        tag = repository.tag_update(tag_id, name=payload.name)
+        if not tag:
+            raise HTTPException(status_code=404, detail='Etiqueta no existeix')
+        session.commit()
+        return TagPublic.model_validate(tag)
+
+    return await run_db(db, update)
 
 @router.delete('/{tag_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_tag(tag_id: int, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    repository = TagRepository(db)
-    delete = repository.tag_delete(tag_id)
-    if not delete:
-        raise HTTPException(status_code=404, detail='Etiqueta no existeix')
-    db.commit()
+async def delete_tag(tag_id: int, db: Session = Depends(get_db), user = Depends(get_current_user)):
+    def delete(session: Session):
+        repository = TagRepository(session)
+        deleted = repository.tag_delete(tag_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail='Etiqueta no existeix')
+        session.commit()
+
+    await run_db(db, delete)
     return None
 
 @router.get('popular/top')
-def get_most_popular_tags(
+async def get_most_popular_tags(
         db: Session = Depends(get_db),
         user=Depends(get_current_user),
 ):
-    repository = TagRepository(db)
-    row = repository.most_popular()
+    row = await run_db(db, lambda session: TagRepository(session).most_popular())
     if not row:
         raise HTTPException(status_code=404, detail='No hi ha etiqueta més popular')
     return row
\ No newline at end of file
@@ -1,6 +1,7 @@
-from typing import Optional
+from typing import Optional, List, Literal
 
 from pydantic import BaseModel, Field, ConfigDict
+from app.services.pagination import PageEnvelope
 
 
 class TagPublic(BaseModel):
@@ -14,5 +15,18 @@ class TagCreate(BaseModel):
 class TagUpdate(BaseModel):
     name: str = Field(..., min_length=4, max_length=35, description='Nom de l\'etiqueta')
 
-class TagWithCount(TagUpdate):
-    uses: int
\ No newline at end of file
+class TagWithCount(TagPublic):
+    post_count: int = Field(0, description='Nombre de posts amb aquesta etiqueta')
+
+class PaginatedTags(PageEnvelope):
+    order_by: Literal['id', 'name', 'post_count']
+    search: Optional[str] = None
+    items: List[TagWithCount]
+
+class TagUsage(TagPublic):
+    uses: int = Field(..., description='Posts amb l\'etiqueta dins la finestra')
+
+class PopularTags(BaseModel):
+    window: Literal['24h', '7d', '30d', 'all']
+    k: int
+    items: List[TagUsage]
@@ -1,6 +1,11 @@
 
-from fastapi import APIRouter, File, UploadFile
-from app.services.file_storage import save_upload_file
+from email.utils import formatdate
+from typing import Optional
+
+from fastapi import APIRouter, File, Header, HTTPException, Request, Response, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from app.services.file_storage import MAX_BYTES, save_upload_file
+from app.services.resumable_uploads import TUS_VERSION, UploadSession, parse_metadata, resumable_uploads
 
 
 router = APIRouter(prefix='/upload', tags=['uploads'])
@@ -23,7 +28,7 @@ async def upload_file(file: UploadFile = File(...)):
 @router.post('/save')
 async def save_file(file: UploadFile = File(...)):
 
-    saved = save_upload_file(file)
+    saved = await run_in_threadpool(save_upload_file, file)
 
     return {
         'filename': saved['filename'],
@@ -35,3 +40,59 @@ async def save_file(file: UploadFile = File(...)):
         # 'chunk_calls': saved['chunk_calls'],
         # 'chunk_size_sample': saved['chunk_size_sample'],
     }
+
+
+# Pujades que es poden reprendre (vegeu resumable_uploads.py):
+#   POST   /upload/sessions                Upload-Length + Upload-Metadata (filename, filetype)
+#   HEAD   /upload/sessions/{id}           -> Upload-Offset: per on continuar
+#   PATCH  /upload/sessions/{id}           Upload-Offset + cos application/offset+octet-stream
+#   POST   /upload/sessions/{id}/finalize  -> com /upload/save
+#   DELETE /upload/sessions/{id}
+
+def _session_headers(session: UploadSession) -> dict:
+    return {
+        'Tus-Resumable': TUS_VERSION,
+        'Upload-Offset': str(session.offset),
+        'Upload-Length': str(session.length),
+        'Upload-Expires': formatdate(session.expires_at, usegmt=True),
+        'Cache-Control': 'no-store',
+    }
+
+@router.post('/sessions', status_code=status.HTTP_201_CREATED)
+async def create_upload_session(upload_length: int = Header(..., ge=1), upload_metadata: Optional[str] = Header(None)):
+    metadata = parse_metadata(upload_metadata)
+    session = await run_in_threadpool(
+        resumable_uploads.create, upload_length, metadata.get('filetype', ''), metadata.get('filename', '')
+    )
+    location = f'{router.prefix}/sessions/{session.id}'
+    return Response(status_code=status.HTTP_201_CREATED,
+                    headers={**_session_headers(session), 'Location': location, 'Tus-Max-Size': str(MAX_BYTES)})
+
+@router.head('/sessions/{upload_id}')
+async def upload_session_offset(upload_id: str):
+    session = await run_in_threadpool(resumable_uploads.load, upload_id)
+    return Response(headers=_session_headers(session))
+
+@router.patch('/sessions/{upload_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def upload_session_chunk(request: Request, upload_id: str, upload_offset: int = Header(..., ge=0),
+                               content_type: str = Header(...)):
+    if content_type != 'application/offset+octet-stream':
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail='Content-Type ha de ser application/offset+octet-stream')
+    # request.stream() lliura el cos a mesura que arriba, sense acumular-lo
+    session = await resumable_uploads.append(upload_id, upload_offset, request.stream())
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_session_headers(session))
+
+@router.post('/sessions/{upload_id}/finalize')
+async def finalize_upload_session(upload_id: str):
+    saved = await run_in_threadpool(resumable_uploads.finalize, upload_id)
+    return {
+        'filename': saved['filename'],
+        'content_type': saved['content_type'],
+        'url': saved['url'],
+    }
+
+@router.delete('/sessions/{upload_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload_session(upload_id: str):
+    await run_in_threadpool(resumable_uploads.delete, upload_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers={'Tus-Resumable': TUS_VERSION})
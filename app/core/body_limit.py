@@ -0,0 +1,54 @@
+import os
+
+from app.services.file_storage import MAX_BYTES, too_large
+from app.services.serialization import dumps
+
+# Límit de mida dels cossos multipart (pujades), aplicat mentre arriben els bytes.
+# Starlette desa tot el formulari (a disc si és gran) abans d'executar l'endpoint, així que sense
+# això un fitxer de 2 GB es rebria sencer abans que save_upload_file el pogués rebutjar.
+# - Content-Length declarat més gran que el límit: 413 immediat, sense llegir el cos.
+# - Si no es declara (chunked) o menteix: es compten els bytes rebuts i en passar del límit
+#   s'interromp la lectura amb un 413.
+
+# Marge per als altres camps del formulari i les capçaleres de cada part
+MAX_REQUEST_OVERHEAD = int(os.getenv('MAX_REQUEST_OVERHEAD', str(1024 * 1024)))
+
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app, max_bytes: int = MAX_BYTES + MAX_REQUEST_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] not in ('POST', 'PUT', 'PATCH'):
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get('headers') or ())
+        if not headers.get(b'content-type', b'').startswith(b'multipart/form-data'):
+            return await self.app(scope, receive, send)
+
+        declared = headers.get(b'content-length', b'')
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            error = too_large()
+            body = dumps({'detail': error.detail})
+            await send({
+                'type': 'http.response.start',
+                'status': error.status_code,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                            (b'connection', b'close')],
+            })
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    # FastAPI deixa passar les HTTPException que surten de llegir el cos
+                    raise too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,26 +1,89 @@
 
+import hashlib
 import os
-from sqlalchemy import create_engine
+from typing import Callable, Optional, TypeVar, Union
+from fastapi import Request
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.engine import create_db_engine, create_async_db_engine
+from app.core.routing import routing_session_class, route_session
 
 # DATABASE_URL = os.getenv("DATABASE_URL")
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///blog.db')
-engine_kwargs = {}
-if DATABASE_URL.startswith('sqlite'):
-    engine_kwargs['connect_args'] = {'check_same_thread': False}
 # if not DATABASE_URL:
 #     raise RuntimeError("DATABASE_URL No esta definida. Configura PostgreSQL")
-engine = create_engine(DATABASE_URL, echo=True, future=True, **engine_kwargs)
-print('DATABASE_URL:', DATABASE_URL)
+# Pool, PRAGMAs de SQLite i eco SQL es configuren a app/core/engine.py (DB_POOL_*, SQLITE_*, DB_ECHO)
+engine = create_db_engine(DATABASE_URL)
+
+# Rèpliques de lectura (opcional): DATABASE_REPLICA_URLS=url1,url2 (vegeu app/core/routing.py)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+replica_engines = [create_db_engine(url) for url in DATABASE_REPLICA_URLS]
+
+SessionLocal = sessionmaker(
+    bind=engine, autoflush=False, autocommit=False, class_=routing_session_class(engine, replica_engines)
+)
+
+# Mode asíncron (DB_ASYNC=true): les peticions fan servir un AsyncSession (aiosqlite / asyncpg)
+# i l'accés a la base de dades no ocupa cap fil del threadpool mentre espera la resposta.
+DB_ASYNC = os.getenv('DB_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+
+def to_async_url(url: str) -> str:
+    if url.startswith('sqlite:'):
+        return 'sqlite+aiosqlite:' + url[len('sqlite:'):]
+    if url.startswith(('postgresql:', 'postgres:', 'postgresql+psycopg2:', 'postgresql+psycopg:')):
+        return 'postgresql+asyncpg:' + url.split(':', 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL') or to_async_url(DATABASE_URL)
 
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, class_=Session)
+async_engine = None
+async_replica_engines = []
+AsyncSessionLocal = None
+if DB_ASYNC:
+    async_engine = create_async_db_engine(ASYNC_DATABASE_URL)
+    async_replica_engines = [create_async_db_engine(to_async_url(url)) for url in DATABASE_REPLICA_URLS]
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine,
+        autoflush=False,
+        class_=AsyncSession,
+        sync_session_class=routing_session_class(
+            async_engine.sync_engine, [replica.sync_engine for replica in async_replica_engines]
+        ),
+    )
 
 class Base(DeclarativeBase):
     pass
 
-def get_db():
+def client_key(request: Request) -> Optional[str]:
+    # Identifica el client per a la finestra "sticky after write": el token si n'hi ha, si no la IP
+    authorization = request.headers.get('authorization')
+    if authorization:
+        return hashlib.sha256(authorization.encode('utf-8')).hexdigest()[:32]
+    return request.client.host if request.client else None
+
+def get_sync_db(request: Request):
     db = SessionLocal()
+    route_session(db, request.method, client_key(request))
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal() as db:
+        route_session(db.sync_session, request.method, client_key(request))
+        yield db
+
+get_db = get_async_db if DB_ASYNC else get_sync_db
+
+T = TypeVar('T')
+
+async def run_db(db: Union[Session, AsyncSession], fn: Callable[..., T], *args, **kwargs) -> T:
+    # Executa codi de repositori (síncron) amb la sessió de la petició:
+    # - AsyncSession: run_sync, l'E/S és asíncrona i no bloqueja el bucle d'esdeveniments
+    # - Session: al threadpool, com feien els endpoints 'def'
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
\ No newline at end of file
@@ -0,0 +1,174 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event, Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Fàbrica d'engines configurable per variables d'entorn:
+# pool (mida, overflow, recycle, pre-ping, timeout), PRAGMAs de SQLite, eco SQL mostrejat
+# i mètriques del pool (espera per agafar connexió, connexions actives, overflow).
+
+logger = logging.getLogger('app.sql')
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_PRE_PING = _env_bool('DB_POOL_PRE_PING', 'true')
+# DB_ECHO: 'false' (per defecte), 'true' (tot) o una fracció entre 0 i 1 per mostrejar sentències
+DB_ECHO = os.getenv('DB_ECHO', 'false').lower()
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),  # negatiu = KiB (64 MB)
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+
+    def record_checkout(self, wait: float, overflow: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_wait_total += wait
+            self.checkout_wait_max = max(self.checkout_wait_max, wait)
+            if overflow:
+                self.overflow_events += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_wait_avg_ms': (self.checkout_wait_total / self.checkouts * 1000) if self.checkouts else 0.0,
+                'checkout_wait_max_ms': self.checkout_wait_max * 1000,
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts,
+            }
+
+
+class _InstrumentedPoolMixin:
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start, overflow=self.overflow() > 0)
+        return conn
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedAsyncPool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith('sqlite') and (':memory:' in url or url.rstrip('/').endswith(('sqlite:', 'aiosqlite:')))
+
+
+def engine_kwargs(url: str, is_async: bool = False) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {'future': True, 'echo': DB_ECHO == 'true'}
+    if url.startswith('sqlite') and not is_async:
+        kwargs['connect_args'] = {'check_same_thread': False}
+    if not _is_memory_sqlite(url):
+        kwargs.update(
+            poolclass=InstrumentedAsyncPool if is_async else InstrumentedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    return kwargs
+
+
+def _install_listeners(sync_engine: Engine) -> None:
+    if sync_engine.dialect.name == 'sqlite':
+        @event.listens_for(sync_engine, 'connect')
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in SQLITE_PRAGMAS.items():
+                    cursor.execute(f'PRAGMA {name}={value}')
+            finally:
+                cursor.close()
+
+    if DB_ECHO not in ('true', 'false'):
+        rate = float(DB_ECHO)
+
+        @event.listens_for(sync_engine, 'before_cursor_execute')
+        def _sample_statement(conn, cursor, statement, parameters, context, executemany):
+            if random.random() < rate:
+                logger.info('%s %r', statement, parameters)
+
+
+def create_db_engine(url: str) -> Engine:
+    engine = create_engine(url, **engine_kwargs(url))
+    _install_listeners(engine)
+    return engine
+
+
+def create_async_db_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(url, **engine_kwargs(url, is_async=True))
+    _install_listeners(engine.sync_engine)
+    return engine
+
+
+def pool_stats(engine: Engine) -> Dict[str, Any]:
+    pool = engine.pool
+    stats: Dict[str, Any] = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+        )
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        stats.update(metrics.snapshot())
+    return stats
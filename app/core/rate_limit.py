@@ -0,0 +1,275 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from app.core.security import token_cache
+from app.services.serialization import dumps
+
+# Limitació de peticions per client amb token buckets (middleware ASGI).
+# - Client: l'usuari si el token ja és a la memòria cau de tokens (verificat per una petició
+#   anterior); si no, la IP. El middleware no verifica res: ho fa la dependència de l'endpoint.
+# - Regles per mètode + prefix de ruta (i opcionalment un paràmetre de consulta), cadascuna amb el
+#   seu bucket: RATE_LIMITS="GET /posts?search=30/minute; POST /posts=60/minute; * /=600/minute".
+#   S'aplica la primera que coincideix.
+# - Backend en memòria repartit en RATE_LIMIT_SHARDS fragments amb el seu propi bloqueig; amb
+#   diversos processos cal un backend compartit (RATE_LIMIT_REDIS_URL) perquè el límit sigui global.
+# - Respostes amb les capçaleres RateLimit-Limit / -Remaining / -Reset / -Policy i, si es rebutja,
+#   429 amb Retry-After.
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMITS = os.getenv('RATE_LIMITS', 'GET /posts?search=30/minute; POST /posts=60/minute; * /=600/minute')
+RATE_LIMIT_SHARDS = int(os.getenv('RATE_LIMIT_SHARDS', '16'))
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+# Darrere d'un proxy de confiança la IP del client és la primera de X-Forwarded-For
+RATE_LIMIT_TRUST_PROXY = os.getenv('RATE_LIMIT_TRUST_PROXY', 'false').lower() in ('1', 'true', 'yes')
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+@dataclass(frozen=True)
+class Limit:
+    requests: int
+    period: int
+
+    @property
+    def rate(self) -> float:
+        # Tokens que es recuperen per segon; la capacitat del bucket és `requests`
+        return self.requests / self.period
+
+    @property
+    def policy(self) -> str:
+        return f'{self.requests};w={self.period}'
+
+    @classmethod
+    def parse(cls, value: str) -> 'Limit':
+        requests, _, period = value.strip().partition('/')
+        return cls(int(requests), PERIODS[period.strip() or 'second'])
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    method: str
+    path: str
+    param: Optional[str]
+    limit: Limit
+
+    def matches(self, method: str, path: str, query: bytes) -> bool:
+        if self.method != '*' and self.method != method:
+            return False
+        if self.path != '/' and path != self.path and not path.startswith(self.path + '/'):
+            return False
+        if self.param is None:
+            return True
+        return any(name == self.param and value for name, value in parse_qsl(query.decode('latin-1')))
+
+
+def parse_rules(value: str) -> List[Rule]:
+    # "MÈTODE /ruta[?paràmetre]=N/periode; ..."
+    rules = []
+    for item in filter(None, (part.strip() for part in value.split(';'))):
+        target, _, limit = item.rpartition('=')
+        method, _, path = target.strip().partition(' ')
+        path, _, param = path.strip().partition('?')
+        rules.append(Rule(target.strip(), method.upper(), path.rstrip('/') or '/', param or None, Limit.parse(limit)))
+    return rules
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    remaining: int
+    reset_after: float  # segons fins que el bucket torna a ser ple
+    retry_after: float  # segons fins que hi haurà un token (0 si s'ha acceptat)
+
+
+def decide(tokens: float, limit: Limit, allowed: bool) -> Decision:
+    return Decision(
+        allowed=allowed,
+        remaining=int(tokens),
+        reset_after=(limit.requests - tokens) / limit.rate,
+        retry_after=0.0 if allowed else (1 - tokens) / limit.rate,
+    )
+
+
+class RateLimitBackend:
+    # Interfície d'un backend: consumeix un token del bucket `key` si n'hi ha
+    async def acquire(self, key: str, limit: Limit) -> Decision:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class _Shard:
+    __slots__ = ('lock', 'buckets')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: OrderedDict[str, List[float]] = OrderedDict()
+
+
+class MemoryBackend(RateLimitBackend):
+    # Buckets per procés repartits per hash de la clau: cada fragment té el seu bloqueig i un LRU
+    # acotat (un bucket expulsat és d'un client inactiu, que en tornar el troba ple)
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._max_per_shard = max(1, max_keys // len(self._shards))
+
+    async def acquire(self, key: str, limit: Limit) -> Decision:
+        return self.acquire_sync(key, limit)
+
+    def acquire_sync(self, key: str, limit: Limit) -> Decision:
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [float(limit.requests), now]
+                if len(shard.buckets) > self._max_per_shard:
+                    shard.buckets.popitem(last=False)
+            else:
+                shard.buckets.move_to_end(key)
+                bucket[0] = min(float(limit.requests), bucket[0] + (now - bucket[1]) * limit.rate)
+                bucket[1] = now
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+            tokens = bucket[0]
+        return decide(tokens, limit, allowed)
+
+    def stats(self) -> Dict[str, int]:
+        return {'shards': len(self._shards), 'keys': sum(len(shard.buckets) for shard in self._shards)}
+
+
+class RedisBackend(RateLimitBackend):
+    # Bucket compartit entre processos: l'actualització és atòmica dins d'un script Lua
+    SCRIPT = """
+    local limit, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens, ts = tonumber(state[1]), tonumber(state[2])
+    if tokens == nil then
+        tokens, ts = limit, now
+    end
+    tokens = math.min(limit, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(limit / rate * 1000))
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str, prefix: str = 'ratelimit:'):
+        try:
+            from redis import asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError('RATE_LIMIT_REDIS_URL requereix el paquet redis (pip install redis)') from exc
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    async def acquire(self, key: str, limit: Limit) -> Decision:
+        allowed, tokens = await self._script(keys=[self.prefix + key], args=[limit.requests, limit.rate, time.time()])
+        return decide(float(tokens), limit, bool(allowed))
+
+
+def client_identity(scope) -> str:
+    # Sense descodificar el JWT ni mirar revocacions: un token desconegut (o fals) compta com la seva IP
+    headers = dict(scope.get('headers') or ())
+    authorization = headers.get(b'authorization', b'').decode('latin-1')
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        user = token_cache.peek(token)
+        if user is not None:
+            return 'user:' + user['email']
+    if RATE_LIMIT_TRUST_PROXY and b'x-forwarded-for' in headers:
+        return 'ip:' + headers[b'x-forwarded-for'].decode('latin-1').split(',')[0].strip()
+    client = scope.get('client')
+    return 'ip:' + (client[0] if client else 'unknown')
+
+
+def _headers(rule: Rule, decision: Decision) -> List[Tuple[bytes, bytes]]:
+    headers = [
+        (b'ratelimit-limit', str(rule.limit.requests).encode()),
+        (b'ratelimit-remaining', str(decision.remaining).encode()),
+        (b'ratelimit-reset', str(math.ceil(decision.reset_after)).encode()),
+        (b'ratelimit-policy', rule.limit.policy.encode()),
+    ]
+    if not decision.allowed:
+        headers.append((b'retry-after', str(max(1, math.ceil(decision.retry_after))).encode()))
+    return headers
+
+
+class RateLimiter:
+    def __init__(self, rules: List[Rule], backend: RateLimitBackend):
+        self.rules = rules
+        self.backend = backend
+        self.allowed = 0
+        self.limited = 0
+
+    def match(self, method: str, path: str, query: bytes) -> Optional[Rule]:
+        for rule in self.rules:
+            if rule.matches(method, path, query):
+                return rule
+        return None
+
+    async def check(self, scope) -> Optional[Tuple[Rule, Decision]]:
+        rule = self.match(scope['method'], scope['path'], scope.get('query_string', b''))
+        if rule is None:
+            return None
+        decision = await self.backend.acquire(rule.name + '|' + client_identity(scope), rule.limit)
+        if decision.allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return rule, decision
+
+    def stats(self) -> Dict[str, int]:
+        return {'allowed': self.allowed, 'limited': self.limited, **self.backend.stats()}
+
+
+rate_limiter = RateLimiter(
+    parse_rules(RATE_LIMITS),
+    RedisBackend(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBackend(),
+)
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        result = await self.limiter.check(scope)
+        if result is None:
+            return await self.app(scope, receive, send)
+
+        rule, decision = result
+        headers = _headers(rule, decision)
+        if not decision.allowed:
+            body = dumps({'detail': 'Massa peticions, torna-ho a provar més tard'})
+            await send({
+                'type': 'http.response.start',
+                'status': 429,
+                'headers': headers + [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+            })
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,98 @@
+import itertools
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import Engine, Insert, Update, Delete, event
+from sqlalchemy.orm import Session
+
+# Encaminament primària / rèpliques de lectura.
+# Una sessió marcada com a 'read_only' (peticions GET/HEAD) llegeix d'una rèplica, triada per
+# round-robin o per menys connexions actives. Tota escriptura va a la primària i, un cop la sessió
+# ha escrit, les lectures següents de la mateixa petició també hi van (read-after-write).
+# Opcionalment, un client que acaba d'escriure continua llegint de la primària durant uns segons.
+
+DB_REPLICA_BALANCE = os.getenv('DB_REPLICA_BALANCE', 'round_robin')  # 'round_robin' | 'least_connections'
+DB_STICKY_AFTER_WRITE = float(os.getenv('DB_STICKY_AFTER_WRITE', '0'))
+STICKY_MAX_CLIENTS = 100_000
+
+
+class ReplicaSet:
+    def __init__(self, engines: List[Engine], balance: str = DB_REPLICA_BALANCE):
+        self.engines = engines
+        self.balance = balance
+        self._cycle = itertools.cycle(engines) if engines else None
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def pick(self) -> Engine:
+        if self.balance == 'least_connections':
+            return min(self.engines, key=lambda engine: getattr(engine.pool, 'checkedout', lambda: 0)())
+        with self._lock:
+            return next(self._cycle)
+
+
+class StickyWrites:
+    def __init__(self, window: float = DB_STICKY_AFTER_WRITE, max_clients: int = STICKY_MAX_CLIENTS):
+        self.window = window
+        self.max_clients = max_clients
+        self._until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, client: Optional[str]) -> None:
+        if not client or self.window <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._until) >= self.max_clients:
+                self._until = {key: until for key, until in self._until.items() if until > now}
+            self._until[client] = now + self.window
+
+    def active(self, client: Optional[str]) -> bool:
+        if not client or self.window <= 0:
+            return False
+        with self._lock:
+            until = self._until.get(client)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._until[client]
+                return False
+            return True
+
+
+sticky_writes = StickyWrites()
+
+
+class RoutingSession(Session):
+    primary: Engine
+    replicas: ReplicaSet
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if isinstance(clause, (Insert, Update, Delete)) or self._flushing:
+            self.info['wrote'] = True
+        if not self.replicas or not self.info.get('read_only') or self.info.get('wrote'):
+            return self.primary
+        # Tota la sessió llegeix de la mateixa rèplica
+        replica = self.info.get('replica')
+        if replica is None:
+            replica = self.info['replica'] = self.replicas.pick()
+        return replica
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_writer(session: Session) -> None:
+    if session.info.get('wrote'):
+        sticky_writes.mark(session.info.get('client'))
+
+
+def routing_session_class(primary: Engine, replicas: List[Engine]) -> type:
+    return type('RoutingSession', (RoutingSession,), {'primary': primary, 'replicas': ReplicaSet(replicas)})
+
+
+def route_session(session: Session, method: str, client: Optional[str]) -> None:
+    session.info['client'] = client
+    session.info['read_only'] = method in ('GET', 'HEAD') and not sticky_writes.active(client)
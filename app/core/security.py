@@ -1,15 +1,25 @@
+import hashlib
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
 import jwt
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
 from datetime import timedelta, datetime, timezone
-from typing import Optional
+from typing import Optional, Dict, Any
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
+from app.services.revocation import revocations
+
 SECRET_KEY = os.getenv("SECRET_KEY", "change-me-in-prod")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Memòria cau de tokens ja verificats (0 la desactiva). Una entrada mai dura més que el seu 'exp'.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
 credentials_exception = HTTPException(
@@ -25,6 +35,13 @@ def raise_expired_token():
         headers={"WWW-Authenticate": "Bearer"}
     )
 
+def raise_revoked_token():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail = 'Token revocat',
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+
 def raise_forbidden():
     return HTTPException(
         status_code=status.HTTP_403_FORBIDDEN,
@@ -35,7 +52,8 @@ def raise_forbidden():
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.now(tz=timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    # El jti identifica el token per poder-lo revocar (vegeu app/services/revocation.py)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     token = jwt.encode(payload=to_encode, key=SECRET_KEY, algorithm=ALGORITHM)
     return token
 
@@ -43,19 +61,106 @@ def decode_token(token: str) -> dict:
     payload = jwt.decode(jwt=token, key=SECRET_KEY, algorithms=[ALGORITHM])
     return payload
 
-async def get_current_user(token:str = Depends(oauth2_scheme)):
 
+class TokenCache:
+    # LRU de token verificat -> usuari, indexat pel hash del token (no es guarda el token en clar)
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        if self.max_entries <= 0:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                # Caducat: es torna a verificar perquè decode_token retorni l'error de sempre
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def peek(self, token: str) -> Optional[Dict[str, Any]]:
+        # Com get() però sense comptar-ho ni canviar l'ordre LRU (p. ex. per identificar el client)
+        with self._lock:
+            entry = self._entries.get(self._key(token))
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def set(self, token: str, user: Dict[str, Any], exp: Optional[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._entries[self._key(token)] = (user, expires_at)
+            self._entries.move_to_end(self._key(token))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'size': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
+
+
+token_cache = TokenCache()
+
+
+def _verify(token: str) -> tuple:
+    # (usuari, exp) d'un token no vist abans; HTTPException 401 si la signatura o el contingut no són vàlids
     try:
         payload = decode_token(token)
-        sub: Optional[str] = payload.get("sub")
-        username: Optional[str] = payload.get("username")
-
-        if not sub or not username:
-            raise credentials_exception
-        return {'email': sub, 'username': username}
     except ExpiredSignatureError:
         raise raise_expired_token()
     except InvalidTokenError:
         raise credentials_exception
+    sub: Optional[str] = payload.get("sub")
+    username: Optional[str] = payload.get("username")
+    if not sub or not username:
+        raise credentials_exception
+    return {'email': sub, 'username': username, 'jti': payload.get("jti")}, payload.get("exp")
+
+
+def authenticate(token: str) -> Dict[str, Any]:
+    # Usuari del token (fa servir la memòria cau de tokens); HTTPException 401 si no és vàlid
+    revocations.refresh()
+    user = token_cache.get(token)
+    fresh = user is None
+    if fresh:
+        user, exp = _verify(token)
 
+    # La revocació es comprova abans de fer servir l'usuari, vingui de la memòria cau (que no sap de
+    # revocacions posteriors) o del token acabat de descodificar, i abans de guardar-lo. Sense tocar la BD.
+    if user['jti'] and revocations.is_revoked(user['jti']):
+        token_cache.discard(token)
+        raise raise_revoked_token()
 
+    if fresh:
+        token_cache.set(token, user, exp)
+    return dict(user)
+
+
+async def get_current_user(token:str = Depends(oauth2_scheme)):
+    return authenticate(token)
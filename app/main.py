@@ -1,19 +1,49 @@
 import os
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from app.core.db import Base, engine
+from fastapi import APIRouter, Depends, FastAPI
+from app.core.db import Base, SessionLocal, engine, async_engine, replica_engines, async_replica_engines
+from app.core.engine import pool_stats
+from app.core.security import get_current_user, token_cache
+from app.core.body_limit import BodySizeLimitMiddleware
+from app.core.rate_limit import RateLimitMiddleware, RATE_LIMIT_ENABLED, rate_limiter
+from app.services.full_text import install_full_text_search
+from app.services.tag_counts import install_tag_counts
+from app.services.leaderboard import install_leaderboard
+from app.services.tag_index import install_tag_index
+from app.services.revocation import install_revocations, revocations
+from app.services import media_blobs
+from app.services.image_derivatives import derivatives
+from app.services.media_server import media_server
+from app.services.resumable_uploads import resumable_uploads
 from dotenv import load_dotenv
 from app.api.v1.posts.router import router as posts_router
-from app.api.v1.auth.router import router as auth_router
+from app.api.v1.auth.router import router as auth_router, DEMO_USERS
+from app.api.v1.auth.repository import UserRepository
+from app.services import passwords
 from app.api.v1.uploads.router import router as uploads_router
 from app.api.v1.tags.router import router as tags_router
+from app.api.v1.media.router import router as media_router
 
 load_dotenv()
 MEDIA_DIR = 'app/media/'
+# Només per a desenvolupament i proves (p. ex. AUTH_SEED_DEMO_USERS=true al .env): mai a producció
+AUTH_SEED_DEMO_USERS = os.getenv('AUTH_SEED_DEMO_USERS', 'false').lower() in ('1', 'true', 'yes')
 
 def create_app() -> FastAPI:
     app = FastAPI(title='My Mini Blog')
+    app.add_middleware(BodySizeLimitMiddleware)
+    if RATE_LIMIT_ENABLED:
+        app.add_middleware(RateLimitMiddleware)
     Base.metadata.create_all(bind=engine) # Només s'usa en desenvolupament. En producció caldrà fer migracions
+    install_full_text_search(engine)
+    install_tag_counts(engine)
+    install_leaderboard(engine)
+    install_tag_index(engine)
+    install_revocations(engine)
+    media_blobs.install_media_blobs(engine, MEDIA_DIR)
+    if AUTH_SEED_DEMO_USERS:
+        with SessionLocal() as db:
+            UserRepository(db).seed_users(DEMO_USERS.values())
+            db.commit()
     app.include_router(auth_router, prefix='/api/v1')
     app.include_router(posts_router)
     app.include_router(tags_router)
@@ -21,11 +51,41 @@ def create_app() -> FastAPI:
 
 
     os.makedirs(MEDIA_DIR, exist_ok=True)
-    app.mount('/media', StaticFiles(directory=MEDIA_DIR), name='media')
+    # /media/{nom} serveix els originals i, amb ?w= o ?format=, les variants redimensionades
+    app.include_router(media_router)
 
     @app.get('/')
     def home():
         return {'message': 'Benvinguts al Mini Blog by Eduard Farinyes'}
+
+    # Mètriques internes (pool, login, memòries cau, límits): només per a usuaris autenticats
+    metrics_router = APIRouter(prefix='/metrics', include_in_schema=False, dependencies=[Depends(get_current_user)])
+
+    @metrics_router.get('/db')
+    def db_metrics():
+        metrics = {'sync': pool_stats(engine)}
+        if async_engine is not None:
+            metrics['async'] = pool_stats(async_engine.sync_engine)
+        if replica_engines:
+            metrics['replicas'] = [pool_stats(replica) for replica in replica_engines]
+        if async_replica_engines:
+            metrics['async_replicas'] = [pool_stats(replica.sync_engine) for replica in async_replica_engines]
+        return metrics
+
+    @metrics_router.get('/auth')
+    def auth_metrics():
+        return {'token_cache': token_cache.stats(), 'passwords': passwords.stats(), 'revocations': revocations.stats()}
+
+    @metrics_router.get('/media')
+    def media_metrics():
+        return {**media_blobs.stats(), 'derivatives': derivatives.stats(), 'server': media_server.stats(),
+                'resumable': resumable_uploads.stats()}
+
+    @metrics_router.get('/rate-limit')
+    def rate_limit_metrics():
+        return rate_limiter.stats()
+
+    app.include_router(metrics_router)
     return app
 
 app = create_app()
@@ -1,5 +1,9 @@
 from .author import AuthorORM
 from .post import PostORM, post_tags
 from .tag import TagORM
+from .tag_usage import TagUsageORM
+from .user import UserORM
+from .revoked_token import RevokedTokenORM
+from .media_blob import MediaBlobORM
 
-__all__ = ['AuthorORM', 'PostORM', 'post_tags', 'TagORM']
\ No newline at end of file
+__all__ = ['AuthorORM', 'PostORM', 'post_tags', 'TagORM', 'TagUsageORM', 'UserORM', 'RevokedTokenORM', 'MediaBlobORM']
\ No newline at end of file
@@ -0,0 +1,18 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import Integer, BigInteger, String, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+class MediaBlobORM(Base):
+    # Fitxer pujat guardat pel seu contingut (sha256). refcount = posts amb image_url == url (triggers);
+    # holds = pujades que encara no s'han alliberat (cada pujada compta com una referència)
+    __tablename__ = 'media_blobs'
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    url: Mapped[str] = mapped_column(String(300), unique=True, nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    uploads: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    refcount: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    holds: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default='1')
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_uploaded_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
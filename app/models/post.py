@@ -1,7 +1,7 @@
 from __future__ import annotations
 from datetime import datetime
 from typing import List, Optional, TYPE_CHECKING
-from sqlalchemy import Integer, String, Text, DateTime, ForeignKey, Table, Column
+from sqlalchemy import Integer, String, Text, DateTime, ForeignKey, Table, Column, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.core.db import Base
 from sqlalchemy import UniqueConstraint
@@ -34,3 +34,6 @@ class PostORM(Base):
         lazy='selectin',
         passive_deletes=True
     )
+
+# Índex per a la paginació per cursor ordenada per títol (lower(title), id)
+Index('ix_posts_title_lower_id', func.lower(PostORM.title), PostORM.id)
@@ -0,0 +1,14 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import Integer, String, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+class RevokedTokenORM(Base):
+    # Tokens revocats abans del seu 'exp'. L'id creixent permet als processos llegir només les files noves.
+    __tablename__ = 'revoked_tokens'
+    __table_args__ = {'sqlite_autoincrement': True}  # sense reutilitzar ids després d'esborrar files caducades
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    jti: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+    revoked_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from typing import List, TYPE_CHECKING
-from sqlalchemy import Integer, String
+from sqlalchemy import Integer, String, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.core.db import Base
 
@@ -11,8 +11,15 @@ class TagORM(Base):
     __tablename__ = 'tags'
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String(35), unique=True, index=True)
+    # Nombre de posts amb l'etiqueta, mantingut per triggers sobre post_tags (app/services/tag_counts.py)
+    post_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    # Mai es carrega implícitament: una etiqueta popular arrossegaria mitja taula de posts
     posts: Mapped[List['PostORM']] = relationship(
         secondary='post_tags',
         back_populates='tags',
-        lazy='selectin',
-    )
\ No newline at end of file
+        lazy='raise',
+        passive_deletes=True,
+    )
+
+# Índex per als llistats ordenats per ús (post_count, id)
+Index('ix_tags_post_count_id', TagORM.post_count, TagORM.id)
@@ -0,0 +1,12 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import Integer, DateTime, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+class TagUsageORM(Base):
+    # Ús de cada etiqueta agregat per franges horàries (data de creació dels posts)
+    __tablename__ = 'tag_usage'
+    tag_id: Mapped[int] = mapped_column(ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True, index=True)
+    uses: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
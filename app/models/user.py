@@ -0,0 +1,14 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import Integer, String, DateTime, Boolean
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+class UserORM(Base):
+    __tablename__ = 'users'
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    email: Mapped[str] = mapped_column(String(100), unique=True, index=True, nullable=False)
+    username: Mapped[str] = mapped_column(String(50), nullable=False)
+    password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from sqlalchemy import Select, event, func, select, text
+from sqlalchemy.orm import Session
+
+# Estratègies de recompte per als llistats paginats:
+# - 'exact': count(*) real, guardat a una memòria cau amb TTL per filtre normalitzat.
+# - 'estimate': estadístiques del planificador (PostgreSQL) o mostreig (SQLite) per a taules grans.
+# La memòria cau s'invalida quan es confirma (commit) una sessió que ha escrit a la taula.
+
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', '30'))
+COUNT_CACHE_SIZE = int(os.getenv('COUNT_CACHE_SIZE', '1024'))
+SAMPLE_ROWS = int(os.getenv('COUNT_SAMPLE_ROWS', '10000'))
+
+_DIRTY_KEY = 'count_cache_dirty'
+
+
+class CountCache:
+    def __init__(self, ttl: float = COUNT_CACHE_TTL, max_entries: int = COUNT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: Hashable) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[(namespace, key)]
+                return None
+            self._entries.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace: str, key: Hashable, value: int) -> None:
+        with self._lock:
+            self._entries[(namespace, key)] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str) -> None:
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[cache_key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+count_cache = CountCache()
+
+
+def mark_dirty(db: Session, *namespaces: str) -> None:
+    # Les invalidacions s'apliquen només quan la transacció es confirma
+    db.info.setdefault(_DIRTY_KEY, set()).update(namespaces)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session: Session) -> None:
+    for namespace in session.info.pop(_DIRTY_KEY, ()):
+        count_cache.invalidate(namespace)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_KEY, None)
+
+
+def exact_count(db: Session, stmt: Select) -> int:
+    return db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery())) or 0
+
+
+def estimate_count(db: Session, stmt: Select, id_column) -> Tuple[int, bool]:
+    # Si hi ha menys de SAMPLE_ROWS coincidències el recompte limitat ja és exacte
+    capped = db.scalar(select(func.count()).select_from(stmt.order_by(None).limit(SAMPLE_ROWS).subquery())) or 0
+    if capped < SAMPLE_ROWS:
+        return capped, True
+
+    if db.get_bind().dialect.name == 'postgresql':
+        compiled = stmt.order_by(None).compile(dialect=db.get_bind().dialect, compile_kwargs={'literal_binds': True})
+        plan = db.execute(text(f'EXPLAIN (FORMAT JSON) {compiled}')).scalar()
+        return int(plan[0]['Plan']['Plan Rows']), False
+
+    # Mostreig sobre la finestra dels últims ids: proporció de coincidències dins la finestra
+    # extrapolada a tot el rang d'ids (que es resol amb l'índex de la clau primària).
+    min_id, max_id = db.execute(select(func.min(id_column), func.max(id_column))).one()
+    if min_id is None:
+        return 0, True
+    window_start = max(min_id, max_id - SAMPLE_ROWS + 1)
+    table = id_column.table
+    window_rows = db.scalar(select(func.count()).select_from(table).where(id_column >= window_start)) or 0
+    if window_rows == 0:
+        return capped, False
+    window_matches = exact_count(db, stmt.where(id_column >= window_start))
+    density = window_rows / (max_id - window_start + 1)
+    estimated_rows = density * (max_id - min_id + 1)
+    return max(capped, int(estimated_rows * window_matches / window_rows)), False
+
+
+def count_rows(
+        db: Session,
+        stmt: Select,
+        namespace: str,
+        key: Hashable,
+        mode: str = 'exact',
+        id_column=None,
+) -> Tuple[int, bool]:
+    # Retorna (total, és_exacte)
+    if mode == 'estimate' and id_column is not None:
+        return estimate_count(db, stmt, id_column)
+
+    cached = count_cache.get(namespace, key)
+    if cached is not None:
+        return cached, True
+
+    total = exact_count(db, stmt)
+    count_cache.set(namespace, key, total)
+    return total, True
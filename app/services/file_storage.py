@@ -1,26 +1,43 @@
+import hashlib
 import os
-import shutil
 import uuid
 from fastapi import UploadFile, HTTPException, status
+from app.services import media_blobs
+from app.services.image_derivatives import derivatives
 
 
 MEDIA_DIR = 'app/media'
+# Fitxers a mig escriure: fora de /media (no es poden servir) però al mateix disc perquè el rename sigui atòmic
+UPLOAD_TMP_DIR = os.getenv('UPLOAD_TMP_DIR', 'app/.upload_tmp')
 ALLOW_MIME = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp']
 MAX_MB = int(os.getenv('MAX_UPLOAD_MB', '10'))
 CHUNKS = 1024 * 1024
+MAX_BYTES = MAX_MB * 1024 * 1024
+# 'content': un sol fitxer per contingut a ab/cd/<sha256>.<ext> (vegeu media_blobs.py); 'uuid': un fitxer per pujada
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'content')
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/jpg': '.jpg', 'image/png': '.png', 'image/webp': '.webp'}
 
 def ensure_media_dir() -> None:
     os.makedirs(MEDIA_DIR, exist_ok=True)
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+
+def too_large() -> HTTPException:
+    return HTTPException(
+        status_code = status.HTTP_413_CONTENT_TOO_LARGE,
+        detail = f'Arxiu massa gran (>{MAX_MB} MB)'
+    )
 
 def save_upload_file(file: UploadFile) -> dict:
+    # Síncrona: els endpoints la criden amb run_in_threadpool perquè l'E/S no bloquegi el bucle
     if file.content_type not in ALLOW_MIME:
         raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
                             detail='Invalid file type. Only jpg, jpeg, or png are allowed.')
+    # Si ja se sap la mida no cal escriure res
+    if file.size is not None and file.size > MAX_BYTES:
+        raise too_large()
 
     ensure_media_dir()
-    ext = os.path.splitext(file.filename)[1]
-    filename = f'{uuid.uuid4().hex}{ext}'
-    file_path = os.path.join(MEDIA_DIR, filename)
+    tmp_path = os.path.join(UPLOAD_TMP_DIR, uuid.uuid4().hex + '.part')
 
     # Mètode per visualitzar la càrrega de fitxers en trossos petits definits
     # class _ChunkCounter:
@@ -41,20 +58,63 @@ def save_upload_file(file: UploadFile) -> dict:
     #
     # reader = _ChunkCounter(file.file)
 
-    with open(file_path, 'wb') as f:
-        shutil.copyfileobj(file.file, f, length=CHUNKS) # Per veure els chunks, canviar 'file.file' per 'reader'
+    # Es copia per trossos comptant els bytes (i calculant el hash): en passar del límit es para i
+    # s'esborra el temporal. El fitxer només apareix a MEDIA_DIR (rename atòmic) quan està complet.
+    source = file.file  # Per veure els chunks, canviar 'file.file' per 'reader'
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as f:
+            while chunk := source.read(CHUNKS):
+                size += len(chunk)
+                if size > MAX_BYTES:
+                    raise too_large()
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return store_file(tmp_path, digest.hexdigest(), size, file.content_type, file.filename)
+
+
+def store_file(tmp_path: str, sha256: str, size: int, content_type: str, original_name: str = '') -> dict:
+    # Porta a MEDIA_DIR un fitxer ja complet de UPLOAD_TMP_DIR (rename atòmic, mateix disc).
+    # També la fan servir les pujades per trossos (vegeu resumable_uploads.py).
+    try:
+        if MEDIA_STORAGE == 'content':
+            filename = media_blobs.blob_name(sha256, EXTENSIONS[content_type])
+            file_path = os.path.join(MEDIA_DIR, filename)
+            media_blobs.record_upload(sha256, f'/media/{filename}', size)
+            try:
+                # Ja hi és: no cal escriure'l (es toca l'mtime perquè el sweeper no l'esborri ara)
+                os.utime(file_path)
+                os.remove(tmp_path)
+                media_blobs.counters.record(size, deduplicated=True)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                os.replace(tmp_path, file_path)
+                media_blobs.counters.record(size, deduplicated=False)
+        else:
+            filename = f'{uuid.uuid4().hex}{os.path.splitext(original_name)[1]}'
+            file_path = os.path.join(MEDIA_DIR, filename)
+            os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
 
-    size = os.path.getsize(file_path)
-    if size > MAX_MB * CHUNKS:
-        os.remove(file_path)
-        raise HTTPException(
-            status_code = status.HTTP_413_CONTENT_TOO_LARGE,
-            detail = f'Arxiu massa gran (>{MAX_MB} MB)'
-        )
+    # Miniatures i WebP en segon pla (si ja existeixen per aquest contingut no es refan)
+    derivatives.pregenerate(file_path)
 
     return {
         'filename': filename,
-        'content_type': file.content_type,
+        'content_type': content_type,
         'url': f'/media/{filename}',
         # 'size': size,
         # 'chunk_size_used': CHUNKS,
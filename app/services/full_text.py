@@ -0,0 +1,93 @@
+import re
+from typing import Optional, Tuple
+
+from sqlalchemy import Engine, Select, func, literal_column, or_, text, table, column
+from sqlalchemy.orm import Session
+
+from app.models import PostORM
+
+# Índex de text complet per als posts (títol + contingut).
+# - SQLite: taula virtual FTS5 amb contingut extern i triggers que la mantenen sincronitzada.
+# - PostgreSQL: columna tsvector generada + índex GIN.
+# - Altres motors: es manté el LIKE com a últim recurs.
+
+FTS_TABLE = 'posts_fts'
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content, content='posts', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON posts BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON posts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+_POSTGRES_DDL = [
+    """ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(content, '')), 'B')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_posts_search_vector ON posts USING GIN (search_vector)",
+]
+
+_fts = table(FTS_TABLE, column('rowid'))
+
+
+def install_full_text_search(engine: Engine) -> None:
+    with engine.begin() as conn:
+        if engine.dialect.name == 'sqlite':
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+            ).first()
+            for ddl in _SQLITE_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                # Indexa els posts que ja existien abans de crear la taula FTS
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        elif engine.dialect.name == 'postgresql':
+            for ddl in _POSTGRES_DDL:
+                conn.execute(text(ddl))
+
+
+def _terms(query: str) -> list[str]:
+    return re.findall(r'\w+', query.lower())
+
+
+def apply_full_text(db: Session, results: Select, query: str) -> Tuple[Select, Optional[object]]:
+    # Retorna la consulta filtrada i una expressió de rellevància (com més petita, més rellevant).
+    # Si el motor no té índex de text complet, la rellevància és None.
+    terms = _terms(query)
+    if not terms:
+        return results, None
+
+    dialect = db.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        # Cada terme com a prefix entre cometes: "fast"* "api"*
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rank = func.bm25(literal_column(FTS_TABLE), TITLE_WEIGHT, CONTENT_WEIGHT)
+        results = (
+            results.join(_fts, _fts.c.rowid == PostORM.id)
+            .where(literal_column(FTS_TABLE).op('MATCH')(match))
+        )
+        return results, rank
+
+    if dialect == 'postgresql':
+        ts_query = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        search_vector = literal_column('posts.search_vector')
+        results = results.where(search_vector.op('@@')(ts_query))
+        return results, -func.ts_rank(search_vector, ts_query)
+
+    pattern = f'%{query}%'
+    return results.where(or_(PostORM.title.like(pattern), PostORM.content.like(pattern))), None
@@ -0,0 +1,198 @@
+import asyncio
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow és opcional: sense ell es serveixen sempre els originals
+    Image = None
+
+# Variants redimensionades de les imatges pujades (miniatures i WebP).
+# - Es generen en un ProcessPoolExecutor acotat (IMAGE_WORKERS): el redimensionat és CPU pur.
+# - Després de cada pujada es preparen les variants de IMAGE_PRESETS en segon pla; qualsevol
+#   altra es genera la primera vegada que es demana (/media/{nom}?w=320&format=webp).
+# - Cache a disc a DERIVATIVES_DIR, amb nom = hash del contingut original + paràmetres, de manera
+#   que no cal invalidar res (el contingut d'un hash no canvia).
+# - Single-flight: peticions simultànies de la mateixa variant esperen la mateixa feina.
+
+DERIVATIVES_DIR = os.getenv('DERIVATIVES_DIR', 'app/.derivatives')
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(min(2, os.cpu_count() or 1))))
+# Amples permesos: el demanat s'arrodoneix al següent (limita el nombre de variants per imatge)
+IMAGE_WIDTHS = sorted(int(width) for width in os.getenv('IMAGE_WIDTHS', '160,320,640,1280').split(','))
+IMAGE_PRESETS = os.getenv('IMAGE_PRESETS', '320:webp,640:webp')
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '80'))
+IMAGE_MAX_PENDING = int(os.getenv('IMAGE_MAX_PENDING', '100'))
+# Hashes calculats de fitxers amb nom antic (uuid) que es recorden (LRU)
+SOURCE_HASH_CACHE_SIZE = int(os.getenv('SOURCE_HASH_CACHE_SIZE', '4096'))
+
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg'), 'png': ('PNG', 'image/png')}
+SOURCE_FORMATS = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png', '.webp': 'webp'}
+_SHA256_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+logger = logging.getLogger('app.media')
+
+available = Image is not None
+
+
+def _render(source: str, destination: str, width: int, fmt: str, quality: int) -> str:
+    # S'executa en un procés del pool: obre, redimensiona (mai amplia) i desa de forma atòmica
+    with Image.open(source) as image:
+        image.draft('RGB', (width, width * 10))  # JPEG: descodifica ja reduït, molt més ràpid
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image.thumbnail((width, image.height * width // image.width + 1), Image.LANCZOS)
+        pil_format = FORMATS[fmt][0]
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        tmp = f'{destination}.{uuid.uuid4().hex}.part'
+        try:
+            image.save(tmp, pil_format, quality=quality, optimize=True)
+            os.replace(tmp, destination)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return destination
+
+
+class DerivativePipeline:
+    def __init__(self, workers: int = IMAGE_WORKERS, max_pending: int = IMAGE_MAX_PENDING):
+        self.available = available
+        self.workers = workers
+        self.max_pending = max_pending
+        self.generated = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, Future] = {}
+        self._hashes: OrderedDict[Tuple[str, float, int], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: l'aplicació té fils en marxa i fer fork amb fils pot deixar bloquejos penjats
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def source_hash(self, path: str) -> str:
+        # Els noms adreçats per contingut ja porten el hash; els antics (uuid) es calculen un cop
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if _SHA256_NAME.match(stem):
+            return stem
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest is not None:
+                self._hashes.move_to_end(key)
+                return digest
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        with self._lock:
+            self._hashes[key] = digest
+            while len(self._hashes) > SOURCE_HASH_CACHE_SIZE:
+                self._hashes.popitem(last=False)
+        return digest
+
+    @staticmethod
+    def snap_width(width: int) -> int:
+        for allowed in IMAGE_WIDTHS:
+            if width <= allowed:
+                return allowed
+        return IMAGE_WIDTHS[-1]
+
+    @staticmethod
+    def output_format(source: str, fmt: Optional[str]) -> str:
+        return fmt or SOURCE_FORMATS.get(os.path.splitext(source)[1].lower(), 'jpeg')
+
+    def variant_path(self, source: str, width: int, fmt: str) -> str:
+        digest = self.source_hash(source)
+        return os.path.join(DERIVATIVES_DIR, digest[:2], f'{digest}_w{width}_q{IMAGE_QUALITY}.{fmt}')
+
+    def locate(self, source: str, width: int, fmt: str) -> Tuple[str, bool]:
+        # (camí de la variant, si ja existeix). Toca el disc: des del bucle, amb asyncio.to_thread
+        destination = self.variant_path(source, width, fmt)
+        return destination, os.path.exists(destination)
+
+    def submit(self, source: str, width: int, fmt: str, background: bool = False,
+               destination: Optional[str] = None) -> Optional[Future]:
+        # Retorna la feina (nova o la que ja està en marxa) que deixa la variant a disc
+        destination = destination or self.variant_path(source, width, fmt)
+        executor = self._get_executor()
+        with self._lock:
+            pending = self._inflight.get(destination)
+            if pending is not None:
+                self.coalesced += 1
+                return pending
+            if background and len(self._inflight) >= self.max_pending:
+                # Massa feina acumulada: ja es generarà quan algú la demani
+                self.dropped += 1
+                return None
+            future = self._inflight[destination] = executor.submit(_render, source, destination, width, fmt, IMAGE_QUALITY)
+        future.add_done_callback(lambda done: self._finished(destination, done))
+        return future
+
+    def _finished(self, destination: str, future: Future) -> None:
+        with self._lock:
+            self._inflight.pop(destination, None)
+            if future.exception() is None:
+                self.generated += 1
+        if future.exception() is not None:
+            logger.warning('image derivative failed: %s (%s)', destination, future.exception())
+
+    async def get(self, source: str, width: int, fmt: Optional[str]) -> Tuple[str, str]:
+        # (camí, content-type) de la variant, generant-la si encara no existeix
+        width, fmt = self.snap_width(width), self.output_format(source, fmt)
+        destination, exists = await asyncio.to_thread(self.locate, source, width, fmt)
+        if not exists:
+            await asyncio.wrap_future(self.submit(source, width, fmt, destination=destination))
+        return destination, FORMATS[fmt][1]
+
+    def pregenerate(self, source: str) -> None:
+        # Variants habituals després d'una pujada, sense esperar-les. Síncrona: la crida store_file()
+        # des del threadpool, mai des del bucle
+        if not self.available:
+            return
+        for preset in filter(None, (item.strip() for item in IMAGE_PRESETS.split(','))):
+            width, _, fmt = preset.partition(':')
+            width, fmt = self.snap_width(int(width)), self.output_format(source, fmt or None)
+            destination, exists = self.locate(source, width, fmt)
+            if not exists:
+                self.submit(source, width, fmt, background=True, destination=destination)
+
+    def remove_variants(self, digest: str) -> int:
+        paths = glob.glob(os.path.join(DERIVATIVES_DIR, digest[:2], f'{digest}_*'))
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(paths)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'available': self.available,
+            'workers': self.workers,
+            'inflight': len(self._inflight),
+            'generated': self.generated,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'hashed_sources': len(self._hashes),
+        }
+
+
+derivatives = DerivativePipeline()
@@ -0,0 +1,264 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Engine, delete, event, exists, func, insert, select, update
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session
+
+from app.models import PostORM, TagORM, TagUsageORM, post_tags
+from app.services.tag_counts import recount_tags
+
+# Rànquing de popularitat d'etiquetes.
+# - Total: tags.post_count (mantingut per triggers, vegeu tag_counts.py).
+# - Finestres (24h / 7d / 30d): taula tag_usage amb l'ús agregat per hores segons la data de
+#   creació del post. Els repositoris hi sumen o resten quan es creen o s'esborren posts.
+# Per a cada finestra es calcula el top LEADERBOARD_MAX_K (amb marge) i es guarda en memòria. Cada
+# escriptura confirmada hi aplica els seus deltes per etiqueta sense tornar a consultar; només es
+# recalcula si amb els deltes ja no es pot saber el top exacte, quan canvia la franja horària (la
+# finestra es desplaça) o quan caduca el TTL (escriptures d'altres processos). Una consulta costa O(K).
+
+WINDOWS: Dict[str, Optional[timedelta]] = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    'all': None,
+}
+BUCKET = timedelta(hours=1)
+RETENTION = max(window for window in WINDOWS.values() if window is not None)
+LEADERBOARD_MAX_K = int(os.getenv('LEADERBOARD_MAX_K', '100'))
+LEADERBOARD_TTL = float(os.getenv('LEADERBOARD_TTL', '60'))
+
+_CHANGES_KEY = 'leaderboard_changes'
+_RESET_KEY = 'leaderboard_reset'
+RACE_TTL = 1.0
+_pruned_bucket: Optional[datetime] = None
+
+
+def utcnow() -> datetime:
+    # Les dates dels posts es guarden en UTC sense zona horària
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def bucket_of(when: datetime) -> datetime:
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def _rank_key(row: dict) -> tuple:
+    # El mateix ordre que la consulta: més usos primer, després per nom
+    return -row['uses'], row['name'].lower()
+
+
+class _Ranking:
+    # Top d'una finestra calculat a partir de la base de dades i mantingut amb deltes
+    def __init__(self, rows: List[dict], start: Optional[datetime], bucket: datetime, expires_at: float, limit: int):
+        self.rows = rows
+        self.start = start
+        self.bucket = bucket
+        self.expires_at = expires_at
+        # Cap etiqueta de fora de la llista passa per davant de l'última fila llegida (None: no n'hi ha cap amb usos)
+        self.floor = _rank_key(rows[-1]) if len(rows) >= limit else None
+        self.outside: Counter = Counter()
+
+    def apply(self, deltas: Counter) -> None:
+        rows = []
+        for row in self.rows:
+            uses = row['uses'] + deltas.pop(row['id'], 0)
+            if uses > 0:
+                rows.append(dict(row, uses=uses))
+        self.rows = sorted(rows, key=_rank_key)
+        # D'aquestes no se'n sap el total (ni el nom), només quant han pujat com a molt
+        self.outside.update(deltas)
+
+    def exact(self, k: int) -> bool:
+        # Cert si les k primeres files segur que són el top real de la finestra
+        grown = [delta for delta in self.outside.values() if delta > 0]
+        if len(self.rows) < k:
+            return self.floor is None and not grown
+        boundary = _rank_key(self.rows[k - 1])
+        if self.floor is not None and boundary > self.floor:
+            return False
+        ceiling = 0 if self.floor is None else -self.floor[0]
+        return all(-boundary[0] > ceiling + delta for delta in grown)
+
+
+class Leaderboard:
+    def __init__(self, ttl: float = LEADERBOARD_TTL, max_k: int = LEADERBOARD_MAX_K):
+        self.ttl = ttl
+        self.max_k = max_k
+        self._entries: Dict[str, _Ranking] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def top(self, db: Session, window: str, k: int) -> List[dict]:
+        current = bucket_of(utcnow())
+        with self._lock:
+            entry = self._entries.get(window)
+            generation = self._generation
+        if entry is None or entry.expires_at < time.monotonic() or entry.bucket != current:
+            entry = self._compute(db, window, current)
+            with self._lock:
+                # Commits confirmats mentre es llegia: potser no hi són i els seus deltes ja s'han aplicat
+                # (a res). Es guarda igualment però caduca aviat, perquè escriptures constants no obliguin
+                # a recalcular a cada petició.
+                if self._generation != generation:
+                    entry.expires_at = min(entry.expires_at, time.monotonic() + RACE_TTL)
+                self._entries[window] = entry
+        return entry.rows[:k]
+
+    def apply(self, changes: List[tuple]) -> None:
+        # changes: (tag_id, data del post, delta) de cada escriptura confirmada
+        with self._lock:
+            self._generation += 1
+            for window, entry in list(self._entries.items()):
+                deltas: Counter = Counter()
+                for tag_id, when, delta in changes:
+                    if entry.start is None or (when is not None and bucket_of(when) >= entry.start):
+                        deltas[tag_id] += delta
+                if not deltas:
+                    continue
+                entry.apply(deltas)
+                if not entry.exact(self.max_k):
+                    del self._entries[window]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def _compute(self, db: Session, window: str, current: datetime) -> _Ranking:
+        span = WINDOWS[window]
+        start = None if span is None else current - span + BUCKET
+        if span is None:
+            uses = TagORM.post_count
+            ranking = select(TagORM.id, TagORM.name, uses.label('uses')).where(uses > 0)
+        else:
+            uses = func.sum(TagUsageORM.uses)
+            ranking = (
+                select(TagORM.id, TagORM.name, uses.label('uses'))
+                .join(TagUsageORM, TagUsageORM.tag_id == TagORM.id)
+                .where(TagUsageORM.bucket >= start)
+                .group_by(TagORM.id, TagORM.name)
+                .having(uses > 0)
+            )
+        # El doble de K: les files de més enllà de K absorbeixen els deltes (vegeu _Ranking.exact)
+        limit = 2 * self.max_k
+        rows = db.execute(ranking.order_by(uses.desc(), func.lower(TagORM.name).asc()).limit(limit)).mappings()
+        return _Ranking([dict(row) for row in rows], start, current, time.monotonic() + self.ttl, limit)
+
+
+leaderboard = Leaderboard()
+
+
+def reset_on_commit(db: Session) -> None:
+    # Canvis que no es poden expressar com a deltes (etiqueta esborrada o reanomenada, reconstrucció)
+    db.info[_RESET_KEY] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_after_commit(session: Session) -> None:
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if session.info.pop(_RESET_KEY, False):
+        leaderboard.invalidate()
+    elif changes:
+        leaderboard.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_CHANGES_KEY, None)
+    session.info.pop(_RESET_KEY, None)
+
+
+def _upsert(db: Session, rows: List[dict]) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(TagUsageORM)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=['tag_id', 'bucket'], set_={'uses': TagUsageORM.uses + stmt.excluded.uses}
+        ), rows)
+        return
+    for row in rows:
+        updated = db.execute(
+            update(TagUsageORM)
+            .where(TagUsageORM.tag_id == row['tag_id'], TagUsageORM.bucket == row['bucket'])
+            .values(uses=TagUsageORM.uses + row['uses'])
+        ).rowcount
+        if not updated:
+            db.execute(insert(TagUsageORM), row)
+
+
+def record_usage(db: Session, tag_ids: Iterable[int], when: Optional[datetime], delta: int = 1) -> None:
+    # Suma (o resta, amb delta negatiu) un ús per cada aparició de l'etiqueta a la franja de `when`
+    global _pruned_bucket
+    # 'all' (post_count) compta també els posts més antics que RETENTION
+    db.info.setdefault(_CHANGES_KEY, []).extend((tag_id, when, delta) for tag_id in tag_ids)
+    current = bucket_of(utcnow())
+    if _pruned_bucket != current:
+        # Com a molt una neteja de franges caducades per hora i procés
+        _pruned_bucket = current
+        prune(db)
+    if when is None or when < current - RETENTION:
+        return
+    bucket = bucket_of(when)
+    rows = [{'tag_id': tag_id, 'bucket': bucket, 'uses': uses * delta} for tag_id, uses in Counter(tag_ids).items()]
+    if rows:
+        _upsert(db, rows)
+
+
+def forget_tag(db: Session, tag_id: int) -> None:
+    db.execute(delete(TagUsageORM).where(TagUsageORM.tag_id == tag_id))
+    reset_on_commit(db)
+
+
+def prune(db: Session) -> int:
+    # Les franges que ja no entren a cap finestra
+    return db.execute(delete(TagUsageORM).where(TagUsageORM.bucket < bucket_of(utcnow()) - RETENTION)).rowcount
+
+
+def rebuild(db: Session) -> int:
+    # Reconstrueix els comptadors des de zero a partir de posts i post_tags. Retorna les franges creades.
+    recount_tags(db.connection())
+    db.execute(delete(TagUsageORM))
+    since = bucket_of(utcnow()) - RETENTION
+    usage: Counter = Counter()
+    links = db.execute(
+        select(post_tags.c.tag_id, PostORM.created_at)
+        .join(PostORM, PostORM.id == post_tags.c.post_id)
+        .where(PostORM.created_at >= since)
+        .execution_options(yield_per=10_000)
+    )
+    for tag_id, created_at in links:
+        usage[(tag_id, bucket_of(created_at))] += 1
+    rows = [{'tag_id': tag_id, 'bucket': bucket, 'uses': uses} for (tag_id, bucket), uses in usage.items()]
+    if rows:
+        db.execute(insert(TagUsageORM), rows)
+    reset_on_commit(db)
+    return len(rows)
+
+
+def install_leaderboard(engine: Engine) -> None:
+    # Primera arrencada amb la taula tag_usage buida però amb posts recents: s'omple des de zero
+    with Session(engine) as session:
+        since = bucket_of(utcnow()) - RETENTION
+        empty = not session.scalar(select(exists().select_from(TagUsageORM)))
+        if empty and session.scalar(select(exists().where(PostORM.created_at >= since))):
+            rebuild(session)
+            session.commit()
+
+
+if __name__ == '__main__':
+    # python -m app.services.leaderboard rebuild | prune
+    from app.core.db import SessionLocal
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'rebuild'
+    if command not in ('rebuild', 'prune'):
+        sys.exit('Ús: python -m app.services.leaderboard [rebuild|prune]')
+    with SessionLocal() as session:
+        affected = rebuild(session) if command == 'rebuild' else prune(session)
+        session.commit()
+    print(f'{command}: {affected} franges')
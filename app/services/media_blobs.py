@@ -0,0 +1,252 @@
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Tuple
+
+from sqlalchemy import Connection, Engine, delete, func, inspect, select, text, update
+from sqlalchemy.dialects import sqlite, postgresql
+
+from app.core.db import engine as default_engine
+from app.models import MediaBlobORM
+from app.services.image_derivatives import derivatives
+
+# Emmagatzematge adreçat per contingut dels fitxers pujats (vegeu file_storage.py).
+# - Cada fitxer es guarda una sola vegada a MEDIA_DIR/ab/cd/<sha256>.<ext>; si ja hi és no s'escriu.
+# - La taula media_blobs en porta el registre: mida, quantes vegades s'ha pujat i quants posts
+#   l'apunten (refcount, mantingut per triggers sobre posts.image_url com tags.post_count).
+# - Cada pujada també compta com una referència (holds) fins que s'allibera amb release():
+#   POST /posts ho fa un cop el post és desat (o ha fallat); les pujades soltes de /upload
+#   queden retingudes fins que s'alliberen amb la CLI.
+# - sweep() esborra els blobs sense cap referència un cop passat MEDIA_SWEEP_GRACE. El fitxer
+#   s'esborra dins de la mateixa transacció que la fila: una pujada idèntica simultània o bé
+#   espera que acabi (i torna a escriure el fitxer) o bé ja ha sumat la seva referència i el
+#   blob no s'esborra.
+
+MEDIA_SWEEP_GRACE = float(os.getenv('MEDIA_SWEEP_GRACE', '3600'))
+MEDIA_SWEEP_INTERVAL = float(os.getenv('MEDIA_SWEEP_INTERVAL', '3600'))  # 0 = només amb la CLI
+
+logger = logging.getLogger('app.media')
+
+_SQLITE_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS posts_media_ref_ai AFTER INSERT ON posts WHEN new.image_url IS NOT NULL BEGIN
+        UPDATE media_blobs SET refcount = refcount + 1 WHERE url = new.image_url;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_media_ref_ad AFTER DELETE ON posts WHEN old.image_url IS NOT NULL BEGIN
+        UPDATE media_blobs SET refcount = refcount - 1 WHERE url = old.image_url;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_media_ref_au AFTER UPDATE OF image_url ON posts
+        WHEN old.image_url IS NOT new.image_url BEGIN
+        UPDATE media_blobs SET refcount = refcount - 1 WHERE url = old.image_url;
+        UPDATE media_blobs SET refcount = refcount + 1 WHERE url = new.image_url;
+    END""",
+]
+
+_POSTGRES_DDL = [
+    """CREATE OR REPLACE FUNCTION posts_media_ref() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.image_url IS NOT DISTINCT FROM NEW.image_url THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE media_blobs SET refcount = refcount - 1 WHERE url = OLD.image_url;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE media_blobs SET refcount = refcount + 1 WHERE url = NEW.image_url;
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS posts_media_ref ON posts",
+    """CREATE TRIGGER posts_media_ref AFTER INSERT OR DELETE OR UPDATE OF image_url ON posts
+        FOR EACH ROW EXECUTE FUNCTION posts_media_ref()""",
+]
+
+
+class _Counters:
+    # Activitat d'aquest procés (les xifres globals surten de la taula, vegeu stats())
+    def __init__(self):
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, size: int, deduplicated: bool) -> None:
+        with self._lock:
+            if deduplicated:
+                self.deduplicated += 1
+                self.bytes_saved += size
+            else:
+                self.stored += 1
+
+
+counters = _Counters()
+_engine: Engine = default_engine
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def blob_name(sha256: str, ext: str) -> str:
+    # Dos nivells de directoris perquè cap carpeta tingui massa fitxers
+    return f'{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+
+def record_upload(sha256: str, url: str, size: int) -> None:
+    # Registra (o torna a comptar) una pujada. Es fa abans de mirar si el fitxer ja existeix:
+    # last_uploaded_at recent impedeix que sweep() l'esborri mentrestant.
+    row = {'sha256': sha256, 'url': url, 'size': size, 'uploads': 1, 'refcount': 0, 'holds': 1,
+           'created_at': utcnow(), 'last_uploaded_at': utcnow()}
+    with _engine.begin() as conn:
+        dialect = conn.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(MediaBlobORM)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=['sha256'],
+                set_={'uploads': MediaBlobORM.uploads + 1, 'holds': MediaBlobORM.holds + 1,
+                      'last_uploaded_at': stmt.excluded.last_uploaded_at},
+            ), row)
+            return
+        updated = conn.execute(
+            update(MediaBlobORM).where(MediaBlobORM.sha256 == sha256)
+            .values(uploads=MediaBlobORM.uploads + 1, holds=MediaBlobORM.holds + 1,
+                    last_uploaded_at=row['last_uploaded_at'])
+        ).rowcount
+        if not updated:
+            conn.execute(MediaBlobORM.__table__.insert(), row)
+
+
+def release(url: str) -> bool:
+    # Allibera la referència d'una pujada (p. ex. quan ja s'ha associat a un post o s'ha descartat)
+    with _engine.begin() as conn:
+        return bool(conn.execute(
+            update(MediaBlobORM).where(MediaBlobORM.url == url, MediaBlobORM.holds > 0)
+            .values(holds=MediaBlobORM.holds - 1)
+        ).rowcount)
+
+
+def recount_blobs(conn: Connection) -> None:
+    conn.execute(text(
+        "UPDATE media_blobs SET refcount = (SELECT count(*) FROM posts WHERE posts.image_url = media_blobs.url)"
+    ))
+
+
+def sweep(media_dir: str, grace: float = MEDIA_SWEEP_GRACE) -> Tuple[int, int]:
+    # Esborra els blobs sense cap post que els apunti ni pujades pendents. Retorna (fitxers, bytes).
+    cutoff = utcnow() - timedelta(seconds=grace)
+    unreferenced = (MediaBlobORM.refcount <= 0, MediaBlobORM.holds <= 0, MediaBlobORM.last_uploaded_at < cutoff)
+    removed, freed = 0, 0
+    with _engine.connect() as conn:
+        candidates = conn.execute(select(MediaBlobORM.sha256, MediaBlobORM.url, MediaBlobORM.size).where(*unreferenced)).all()
+    for sha256, url, size in candidates:
+        path = os.path.join(media_dir, url.removeprefix('/media/'))
+        with _engine.connect() as conn, conn.begin() as transaction:
+            # Es torna a comprovar: pot haver-se referenciat o tornat a pujar després de la consulta.
+            # La fila queda bloquejada fins al final: record_upload() del mateix contingut espera aquí.
+            deleted = conn.execute(delete(MediaBlobORM).where(MediaBlobORM.sha256 == sha256, *unreferenced)).rowcount
+            if not deleted:
+                continue
+            try:
+                if os.path.getmtime(path) >= cutoff.replace(tzinfo=timezone.utc).timestamp():
+                    # Tocat fa poc (pujada en curs): es deixa, fila inclosa
+                    transaction.rollback()
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            derivatives.remove_variants(sha256)
+            removed += 1
+            freed += size
+    return removed, freed
+
+
+def stats() -> Dict[str, float]:
+    with _engine.connect() as conn:
+        blobs, physical, logical, referenced, held, unreferenced = conn.execute(select(
+            func.count(),
+            func.coalesce(func.sum(MediaBlobORM.size), 0),
+            func.coalesce(func.sum(MediaBlobORM.size * MediaBlobORM.uploads), 0),
+            func.coalesce(func.sum(MediaBlobORM.size * MediaBlobORM.refcount), 0),
+            func.count().filter(MediaBlobORM.holds > 0),
+            func.count().filter(MediaBlobORM.refcount <= 0, MediaBlobORM.holds <= 0),
+        )).one()
+    return {
+        'blobs': blobs,
+        'held_blobs': held,
+        'unreferenced_blobs': unreferenced,
+        'stored_bytes': int(physical),
+        'uploaded_bytes': int(logical),
+        'referenced_bytes': int(referenced),
+        'bytes_saved': int(logical - physical),
+        'dedup_ratio': round(logical / physical, 3) if physical else 1.0,
+        'process': {'stored': counters.stored, 'deduplicated': counters.deduplicated, 'bytes_saved': counters.bytes_saved},
+    }
+
+
+def sweep_once(media_dir: str) -> None:
+    # Una passada del sweeper: blobs sense referències i sessions de pujada per trossos caducades
+    from app.services.resumable_uploads import resumable_uploads
+
+    removed, freed = sweep(media_dir)
+    if removed:
+        logger.info('media sweep: %d blobs, %d bytes', removed, freed)
+    expired = resumable_uploads.purge_expired()
+    if expired:
+        logger.info('media sweep: %d expired upload sessions', expired)
+
+
+def _sweep_periodically(media_dir: str) -> None:
+    while True:
+        time.sleep(MEDIA_SWEEP_INTERVAL)
+        try:
+            sweep_once(media_dir)
+        except Exception:
+            logger.exception('media sweep failed')
+
+
+def install_media_blobs(engine: Engine, media_dir: str) -> None:
+    global _engine
+    _engine = engine
+    with engine.begin() as conn:
+        if 'holds' not in {col['name'] for col in inspect(conn).get_columns('media_blobs')}:
+            # Taula d'abans de holds: els blobs existents queden retinguts (no se sap qui els fa servir)
+            conn.execute(text('ALTER TABLE media_blobs ADD COLUMN holds INTEGER NOT NULL DEFAULT 1'))
+        if engine.dialect.name == 'sqlite':
+            installed = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'posts_media_ref_ai'")
+            ).first()
+            ddl = _SQLITE_DDL
+        elif engine.dialect.name == 'postgresql':
+            installed = conn.execute(text("SELECT 1 FROM pg_trigger WHERE tgname = 'posts_media_ref'")).first()
+            ddl = _POSTGRES_DDL
+        else:
+            ddl, installed = [], True
+        for statement in ddl:
+            conn.execute(text(statement))
+        if not installed:
+            recount_blobs(conn)
+    if MEDIA_SWEEP_INTERVAL > 0:
+        threading.Thread(target=_sweep_periodically, args=(media_dir,), name='media-sweep', daemon=True).start()
+
+
+if __name__ == '__main__':
+    # python -m app.services.media_blobs sweep | recount | stats | release <url>
+    from app.services.file_storage import MEDIA_DIR
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'sweep'
+    if command not in ('sweep', 'recount', 'stats', 'release') or (command == 'release' and len(sys.argv) < 3):
+        sys.exit('Ús: python -m app.services.media_blobs [sweep | recount | stats | release <url>]')
+    if command == 'release':
+        print('alliberat' if release(sys.argv[2]) else 'cap pujada retinguda amb aquesta url')
+    elif command == 'sweep':
+        from app.services.resumable_uploads import resumable_uploads
+
+        print('sweep: %d blobs, %d bytes' % sweep(MEDIA_DIR))
+        print('sessions de pujada caducades: %d' % resumable_uploads.purge_expired())
+    elif command == 'recount':
+        with _engine.begin() as conn:
+            recount_blobs(conn)
+    else:
+        print(stats())
@@ -0,0 +1,129 @@
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate
+from mimetypes import guess_type
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from app.services.response_cache import _etag_matches
+
+# Servei dels fitxers de /media (originals i variants).
+# - Els noms són únics i no es reutilitzen (hash del contingut o uuid), així que el contingut és
+#   immutable: Cache-Control immutable d'un any i ETag fort (el mateix sha256 quan el nom el porta).
+# - If-None-Match -> 304 sense tocar el fitxer.
+# - Range i If-Range amb FileResponse, que fa servir l'extensió ASGI 'http.response.pathsend'
+#   (enviament sense còpia) si el servidor la suporta.
+# - Els fitxers petits més demanats es guarden en un LRU en memòria (MEDIA_CACHE_MAX_BYTES en
+#   total, com a molt MEDIA_CACHE_MAX_FILE cadascun): una resposta servida d'aquí no obre el fitxer.
+
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+MEDIA_CACHE_MAX_FILE = int(os.getenv('MEDIA_CACHE_MAX_FILE', str(256 * 1024)))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# <sha256>.ext (adreçat per contingut) o <sha256>_w320_q80.ext (variant)
+_HASHED_NAME = re.compile(r'^([0-9a-f]{64}(?:_[a-z0-9_]+)?)\.')
+
+
+@dataclass(frozen=True)
+class MediaFile:
+    path: str
+    size: int
+    mtime_ns: int
+    etag: str
+    media_type: str
+    last_modified: str
+    stat: os.stat_result
+    body: Optional[bytes]
+
+
+def strong_etag(path: str, stat: os.stat_result) -> str:
+    match = _HASHED_NAME.match(os.path.basename(path))
+    if match:
+        return f'"{match.group(1)}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+class MediaServer:
+    def __init__(self, max_bytes: int = MEDIA_CACHE_MAX_BYTES, max_file: int = MEDIA_CACHE_MAX_FILE):
+        self.max_bytes = max_bytes
+        self.max_file = max_file
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries: OrderedDict[str, MediaFile] = OrderedDict()
+        self._size = 0
+
+    async def lookup(self, path: str, stat: Optional[os.stat_result] = None) -> MediaFile:
+        # FileNotFoundError si ja no hi és (p. ex. esborrat pel sweeper). Fins i tot un stat pot
+        # bloquejar (disc lent o en xarxa): fora del bucle, o el que ja porta qui crida
+        if stat is None:
+            stat = await run_in_threadpool(os.stat, path)
+        entry = self._entries.get(path)
+        if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        body = None
+        if stat.st_size <= self.max_file:
+            body = await run_in_threadpool(_read, path)
+        entry = MediaFile(
+            path=path,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            etag=strong_etag(path, stat),
+            media_type=guess_type(path)[0] or 'application/octet-stream',
+            last_modified=formatdate(stat.st_mtime, usegmt=True),
+            stat=stat,
+            body=body,
+        )
+        if body is not None:
+            self._store(entry)
+        return entry
+
+    def _store(self, entry: MediaFile) -> None:
+        previous = self._entries.pop(entry.path, None)
+        if previous is not None:
+            self._size -= len(previous.body)
+        self._entries[entry.path] = entry
+        self._size += len(entry.body)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.body)
+
+    async def respond(self, request: Request, path: str, cache_control: str = IMMUTABLE,
+                      stat: Optional[os.stat_result] = None) -> Response:
+        entry = await self.lookup(path, stat)
+        headers = {'ETag': entry.etag, 'Cache-Control': cache_control, 'Last-Modified': entry.last_modified}
+        if _etag_matches(request.headers.get('if-none-match'), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        if entry.body is not None and 'range' not in request.headers:
+            headers['Accept-Ranges'] = 'bytes'
+            return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+        # Fitxers grans o peticions parcials: des del disc, per trossos (o pathsend)
+        # El stat ja s'ha fet (i validat) a lookup(): FileResponse no el repeteix
+        return FileResponse(entry.path, media_type=entry.media_type, headers=headers, stat_result=entry.stat)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+        }
+
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+media_server = MediaServer()
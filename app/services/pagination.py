@@ -1,9 +1,22 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
 from math import ceil
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal
 
-from sqlalchemy import select, func
+from pydantic import BaseModel
+from sqlalchemy import Select, tuple_
 from sqlalchemy.orm import Session
 
+from app.services.counting import count_rows
+
+# Motor de paginació comú per a tots els repositoris. Estratègies:
+# - 'offset': recompte (exacte en memòria cau o estimat) + LIMIT/OFFSET, amb número de pàgina.
+# - 'keyset': cursor opac amb (columna d'ordenació, desempat); cada pàgina costa el mateix que la primera.
+# - 'has_more': LIMIT per_page + 1 sense recompte, només indica si hi ha pàgina següent.
+# Les columnes ordenables són una llista blanca i l'id (o la columna de desempat) fa les pàgines estables.
+
 DEFAULT_PER_PAGE = 10
 MAX_PER_PAGE = 100
 
@@ -13,33 +26,211 @@ def sanitize_pagination(page: int = 1, per_page: int = DEFAULT_PER_PAGE):
     return page, per_page
 
 
-def paginate_query(
-        db: Session,
-        model,
-        base_query = None,
-        page: int = 1,
-        per_page: int = DEFAULT_PER_PAGE,
-        order_by: Optional[str] = None,
-        direction: str = 'asc',
-        allowed_order: Optional[Dict[str, Any]] = None,
-):
-    page, per_page = sanitize_pagination(page, per_page)
-    query = base_query if base_query is not None else select(model)
-
-    total = db.scalar(select(func.count()).select_from(model)) or 0
-    if total == 0:
-        return {"total": 0, "pages": 0, "page": page, "per_page": per_page, "items": []}
-
-    if allowed_order and order_by:
-        col = allowed_order.get(order_by, allowed_order.get('id'))
-        query = query.order_by(col.desc() if direction == 'desc' else col.asc())
-
-    items = db.execute(query.offset((page -1) * per_page).limit(per_page)).scalars().all()
-
-    return {
-        'total': total,
-        'pages': ceil(total / per_page),
-        'page': page,
-        'per_page': per_page,
-        'items': items
-    }
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'No es pot posar {type(value).__name__} en un cursor')
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    raw = json.dumps(values, separators=(',', ':'), ensure_ascii=False, default=_json_default).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    # El cursor és opac per al client: qualsevol error de format es tradueix a ValueError
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError('Cursor invàlid') from exc
+    if not isinstance(values, dict):
+        raise ValueError('Cursor invàlid')
+    return values
+
+
+def cursor_value(value: Any, column) -> Any:
+    # Els valors del cursor els torna el client: només escalars compatibles amb la columna
+    # (un dict o una llista arribaria a tuple_() o al driver i seria un 500)
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('Cursor invàlid')
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = object
+    if python_type is datetime:
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError) as exc:
+            raise ValueError('Cursor invàlid') from exc
+    if python_type is int and not isinstance(value, int):
+        raise ValueError('Cursor invàlid')
+    if python_type is float and isinstance(value, str):
+        raise ValueError('Cursor invàlid')
+    if python_type is str and not isinstance(value, str):
+        raise ValueError('Cursor invàlid')
+    return value
+
+
+STRATEGIES = ('offset', 'keyset', 'has_more')
+
+
+class PageEnvelope(BaseModel):
+    # Embolcall de resposta únic; cada recurs el concreta amb el tipus dels seus elements
+    per_page: int
+    order_by: str
+    direction: Literal['desc', 'asc']
+    page: Optional[int] = None
+    total: Optional[int] = None
+    total_exact: bool = True
+    total_pages: Optional[int] = None
+    has_prev: bool = False
+    has_next: bool = False
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    items: List[Any]
+
+
+@dataclass
+class Page:
+    items: list
+    per_page: int
+    order_by: str
+    direction: str
+    page: Optional[int] = None
+    total: Optional[int] = None
+    total_exact: bool = True
+    has_prev: bool = False
+    has_next: bool = False
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+    @property
+    def total_pages(self) -> Optional[int]:
+        return None if self.total is None else ceil(self.total / self.per_page)
+
+    def envelope(self, **extra: Any) -> Dict[str, Any]:
+        return {
+            'per_page': self.per_page,
+            'order_by': self.order_by,
+            'direction': self.direction,
+            'page': self.page,
+            'total': self.total,
+            'total_exact': self.total_exact,
+            'total_pages': self.total_pages,
+            'has_prev': self.has_prev,
+            'has_next': self.has_next,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'items': self.items,
+            **extra,
+        }
+
+
+class Paginator:
+    def __init__(self, db: Session, model, sortable: Dict[str, Any], tie_breaker: str = 'id', namespace: Optional[str] = None):
+        # `sortable`: nom públic -> expressió SQL; `tie_breaker` ha de ser una clau única de `sortable`
+        self.db = db
+        self.sortable = sortable
+        self.tie_breaker = tie_breaker
+        self.id_column = sortable[tie_breaker]
+        self.namespace = namespace or model.__tablename__
+
+    def _sort_columns(self, order_by: str) -> list:
+        if order_by not in self.sortable:
+            raise ValueError(f'No es pot ordenar per {order_by}')
+        if order_by == self.tie_breaker:
+            return [self.id_column]
+        return [self.sortable[order_by], self.id_column]
+
+    @staticmethod
+    def _ordered(stmt: Select, columns: list, ascending: bool) -> Select:
+        return stmt.order_by(*(col.asc() if ascending else col.desc() for col in columns))
+
+    def paginate(self,
+                 stmt: Select,
+                 strategy: str = 'offset',
+                 per_page: int = DEFAULT_PER_PAGE,
+                 order_by: str = 'id',
+                 direction: str = 'asc',
+                 page: int = 1,
+                 cursor: Optional[str] = None,
+                 count_key: Any = None,
+                 count_mode: str = 'exact',
+    ) -> Page:
+        if strategy == 'keyset':
+            return self.keyset(stmt, per_page, order_by, direction, cursor)
+        if strategy == 'has_more':
+            return self.has_more(stmt, page, per_page, order_by, direction)
+        if strategy == 'offset':
+            return self.offset(stmt, page, per_page, order_by, direction, count_key, count_mode)
+        raise ValueError(f'Estratègia de paginació desconeguda: {strategy}')
+
+    def offset(self, stmt: Select, page: int, per_page: int, order_by: str, direction: str,
+               count_key: Any = None, count_mode: str = 'exact') -> Page:
+        # 2 consultes (1 si el recompte és a la memòria cau)
+        page, per_page = sanitize_pagination(page, per_page)
+        columns = self._sort_columns(order_by)
+        # El total es compta sobre la consulta filtrada, no sobre tota la taula
+        total, total_exact = count_rows(self.db, stmt, self.namespace, count_key, count_mode, id_column=self.id_column)
+        if total == 0:
+            return Page([], per_page, order_by, direction, page=1, total=0, total_exact=total_exact)
+
+        page = min(page, ceil(total / per_page))
+        query = self._ordered(stmt, columns, direction == 'asc')
+        items = list(self.db.execute(query.offset((page - 1) * per_page).limit(per_page)).scalars().all())
+        return Page(items, per_page, order_by, direction, page=page, total=total, total_exact=total_exact,
+                    has_prev=page > 1, has_next=page * per_page < total)
+
+    def has_more(self, stmt: Select, page: int, per_page: int, order_by: str, direction: str) -> Page:
+        # 1 consulta: es demana un element de més per saber si hi ha pàgina següent
+        page, per_page = sanitize_pagination(page, per_page)
+        query = self._ordered(stmt, self._sort_columns(order_by), direction == 'asc')
+        items = list(self.db.execute(query.offset((page - 1) * per_page).limit(per_page + 1)).scalars().all())
+        return Page(items[:per_page], per_page, order_by, direction, page=page, total=None,
+                    has_prev=page > 1, has_next=len(items) > per_page)
+
+    def keyset(self, stmt: Select, per_page: int, order_by: str, direction: str, cursor: Optional[str] = None) -> Page:
+        # 1 consulta: filtra per (columna d'ordenació, desempat) en lloc de fer OFFSET
+        per_page = sanitize_pagination(1, per_page)[1]
+        columns = self._sort_columns(order_by)
+        query = stmt.add_columns(columns[0].label('sort_key'), self.id_column.label('tie_key'))
+
+        position = None
+        if cursor:
+            position = decode_cursor(cursor)
+            if position.get('o') != order_by or position.get('d') != direction or 'k' not in position or 'id' not in position:
+                raise ValueError('Cursor invàlid')
+
+        backwards = position is not None and position.get('p') == 'prev'
+        ascending = (direction == 'asc') != backwards
+
+        if position:
+            boundary = tuple_(*columns)
+            tie = cursor_value(position['id'], self.id_column)
+            if not isinstance(tie, int):
+                raise ValueError('Cursor invàlid')
+            key = tuple_(*([tie] if len(columns) == 1 else [cursor_value(position['k'], columns[0]), tie]))
+            query = query.where(boundary > key if ascending else boundary < key)
+
+        rows = self.db.execute(self._ordered(query, columns, ascending).limit(per_page + 1)).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return Page([], per_page, order_by, direction)
+
+        def make_cursor(row, page_dir: str) -> str:
+            return encode_cursor({'o': order_by, 'd': direction, 'p': page_dir, 'k': row.sort_key, 'id': row.tie_key})
+
+        if backwards:
+            next_cursor = make_cursor(rows[-1], 'next')
+            prev_cursor = make_cursor(rows[0], 'prev') if has_more else None
+        else:
+            next_cursor = make_cursor(rows[-1], 'next') if has_more else None
+            prev_cursor = make_cursor(rows[0], 'prev') if position else None
+
+        return Page([row[0] for row in rows], per_page, order_by, direction,
+                    has_prev=prev_cursor is not None, has_next=next_cursor is not None,
+                    next_cursor=next_cursor, prev_cursor=prev_cursor)
@@ -0,0 +1,156 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+# Hash de contrasenyes amb scrypt (biblioteca estàndard), fora del bucle d'esdeveniments.
+# - El càlcul (desenes de ms) es fa en un pool acotat de fils o de processos, de manera que un
+#   login no bloqueja la resta de peticions.
+# - Paràmetres configurables; els hashes antics es poden detectar amb needs_rehash().
+# - Single-flight: si arriben a la vegada moltes verificacions de les mateixes credencials
+#   (p. ex. un atac de força bruta) només se'n calcula una, i un error recent es recorda uns segons.
+
+PASSWORD_SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', '8'))
+PASSWORD_SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', '1'))
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_EXECUTOR = os.getenv('PASSWORD_HASH_EXECUTOR', 'thread')  # 'thread' | 'process'
+FAILED_VERIFY_TTL = float(os.getenv('FAILED_VERIFY_TTL', '5'))
+FAILED_VERIFY_MAX = 100_000
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+SCHEME = 'scrypt'
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _unb64(data: str) -> bytes:
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode('utf-8'), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES, maxmem=256 * r * (n + p + 2),
+    )
+
+
+def hash_password(password: str) -> str:
+    # Format: scrypt$n$r$p$sal$hash
+    salt = secrets.token_bytes(SALT_BYTES)
+    n, r, p = PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P
+    return '$'.join([SCHEME, str(n), str(r), str(p), _b64(salt), _b64(_scrypt(password, salt, n, r, p))])
+
+
+def _parse(encoded: str) -> Optional[Tuple[int, int, int, bytes, bytes]]:
+    try:
+        scheme, n, r, p, salt, key = encoded.split('$')
+        if scheme != SCHEME:
+            return None
+        return int(n), int(r), int(p), _unb64(salt), _unb64(key)
+    except (ValueError, TypeError):
+        return None
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    parsed = _parse(encoded)
+    if parsed is None:
+        return False
+    n, r, p, salt, key = parsed
+    return hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+
+
+def needs_rehash(encoded: str) -> bool:
+    parsed = _parse(encoded)
+    return parsed is None or parsed[:3] != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+
+
+# Hash de referència per verificar quan l'usuari no existeix (el temps de resposta no ho delata)
+DUMMY_HASH = hash_password(secrets.token_urlsafe(16))
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            pool = ProcessPoolExecutor if PASSWORD_HASH_EXECUTOR == 'process' else ThreadPoolExecutor
+            _executor = pool(max_workers=PASSWORD_HASH_WORKERS)
+        return _executor
+
+
+class _VerifyGuard:
+    def __init__(self, ttl: float = FAILED_VERIFY_TTL, max_entries: int = FAILED_VERIFY_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.coalesced = 0
+        self.rejected = 0
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+        self._failed: Dict[bytes, float] = {}
+
+    def recently_failed(self, key: bytes) -> bool:
+        until = self._failed.get(key)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            del self._failed[key]
+            return False
+        self.rejected += 1
+        return True
+
+    def remember_failure(self, key: bytes) -> None:
+        if len(self._failed) >= self.max_entries:
+            now = time.monotonic()
+            self._failed = {k: until for k, until in self._failed.items() if until > now}
+            if len(self._failed) >= self.max_entries:
+                self._failed.clear()
+        self._failed[key] = time.monotonic() + self.ttl
+
+
+verify_guard = _VerifyGuard()
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), hash_password, password)
+
+
+async def verify_password_async(password: str, encoded: str) -> bool:
+    # La clau inclou el hash guardat: si la contrasenya canvia, els errors recordats ja no s'apliquen
+    key = hashlib.sha256(encoded.encode('utf-8') + b'\0' + password.encode('utf-8')).digest()
+    if verify_guard.recently_failed(key):
+        return False
+
+    pending = verify_guard._inflight.get(key)
+    if pending is not None:
+        verify_guard.coalesced += 1
+        return await asyncio.shield(pending)
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_executor(), verify_password, password, encoded)
+    verify_guard._inflight[key] = future
+    try:
+        valid = await asyncio.shield(future)
+    finally:
+        verify_guard._inflight.pop(key, None)
+    if not valid:
+        verify_guard.remember_failure(key)
+    return valid
+
+
+def stats() -> Dict[str, int]:
+    return {
+        'workers': PASSWORD_HASH_WORKERS,
+        'inflight': len(verify_guard._inflight),
+        'coalesced': verify_guard.coalesced,
+        'rejected_recent_failures': verify_guard.rejected,
+    }
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Memòria cau de respostes JSON per a les lectures de posts.
+# Cada entrada guarda el cos ja serialitzat i un ETag fort (hash del cos) i pertany a un o més
+# grups ('post:5', 'posts:list') que es poden invalidar de cop quan es confirma una escriptura.
+# La invalidació només arriba al procés que fa l'escriptura: amb diversos workers (o llegint d'una
+# rèplica endarrerida) una entrada pot quedar desfasada, així que totes caduquen després de
+# RESPONSE_CACHE_TTL segons (0 = sense caducitat).
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '30'))
+
+_PENDING_KEY = 'response_cache_pending'
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    groups: FrozenSet[str] = field(default_factory=frozenset)
+    expires_at: float = float('inf')  # time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= time.monotonic()
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class CacheBackend:
+    # Interfície mínima d'un backend; es pot substituir per un de compartit (Redis, memcached...)
+    def get(self, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        raise NotImplementedError
+
+    def invalidate_groups(self, groups: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def generation(self) -> int:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LRUCacheBackend(CacheBackend):
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._groups: Dict[str, Set[str]] = {}
+        self._size = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expired:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            for group in entry.groups:
+                self._groups.setdefault(group, set()).add(key)
+            while self._size > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_groups(self, groups: Iterable[str]) -> None:
+        with self._lock:
+            self._generation += 1
+            for group in groups:
+                for key in self._groups.pop(group, set()):
+                    self._remove(key)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._groups.clear()
+            self._size = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= len(entry.body)
+        for group in entry.groups:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+
+
+response_cache: CacheBackend = LRUCacheBackend()
+
+
+def set_backend(backend: CacheBackend) -> None:
+    global response_cache
+    response_cache = backend
+
+
+def invalidate_on_commit(db: Session, *groups: str) -> None:
+    db.info.setdefault(_PENDING_KEY, set()).update(groups)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session: Session) -> None:
+    groups = session.info.pop(_PENDING_KEY, None)
+    if groups:
+        response_cache.invalidate_groups(groups)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    # If-None-Match fa servir comparació feble: W/"x" coincideix amb "x"
+    return '*' in candidates or etag in (c[2:] if c.startswith('W/') else c for c in candidates)
+
+
+def _to_response(request: Request, entry: CachedResponse) -> Response:
+    headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+    if _etag_matches(request.headers.get('if-none-match'), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type='application/json', headers=headers)
+
+
+async def cached_json(request: Request, key: str, build: Callable[[], Awaitable[Tuple[bytes, Iterable[str]]]]) -> Response:
+    # `build` retorna (de forma asíncrona) el cos JSON i els grups d'invalidació de la resposta
+    backend = response_cache
+    entry = backend.get(key)
+    if entry is None:
+        generation = backend.generation()
+        body, groups = await build()
+        expires_at = time.monotonic() + RESPONSE_CACHE_TTL if RESPONSE_CACHE_TTL > 0 else float('inf')
+        entry = CachedResponse(body=body, etag=make_etag(body), groups=frozenset(groups), expires_at=expires_at)
+        # Si mentrestant s'ha invalidat alguna cosa, la resposta pot estar desfasada: no es guarda
+        if backend.generation() == generation:
+            backend.set(key, entry)
+    return _to_response(request, entry)
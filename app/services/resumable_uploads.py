@@ -0,0 +1,255 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, BinaryIO, Dict, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.file_storage import ALLOW_MIME, CHUNKS, MAX_BYTES, UPLOAD_TMP_DIR, ensure_media_dir, store_file, too_large
+
+try:
+    import fcntl
+except ImportError:  # Windows: sense bloqueig entre processos (dins d'un procés ja ho fa _busy)
+    fcntl = None
+
+# Pujades per trossos que es poden reprendre (protocol a l'estil de tus.io).
+# - POST crea la sessió amb la mida total; PATCH hi afegeix bytes a partir d'un Upload-Offset que
+#   ha de coincidir amb el que ja hi ha; HEAD diu per on va; finalize la porta a file_storage.
+# - Cada sessió són dos fitxers a RESUMABLE_DIR: <id>.part (les dades, la seva mida és l'offset, de
+#   manera que sobreviu a reinicis) i <id>.json (mida total, tipus, nom, caducitat).
+# - El cos del PATCH s'escriu a mesura que arriba, tros a tros: la memòria no depèn de la mida del
+#   tros. Si la connexió cau, el que ja s'ha rebut es queda i el client continua des d'aquí.
+# - Les sessions caduquen (UPLOAD_SESSION_TTL); les caducades s'esborren en crear-ne de noves i a
+#   cada passada del sweeper de media_blobs (també amb el servidor inactiu).
+# - El fitxer finalitzat queda retingut com qualsevol altra pujada (vegeu media_blobs.release()).
+
+UPLOAD_SESSION_TTL = float(os.getenv('UPLOAD_SESSION_TTL', str(24 * 3600)))
+RESUMABLE_DIR = os.getenv('RESUMABLE_DIR', os.path.join(UPLOAD_TMP_DIR, 'resumable'))
+PURGE_INTERVAL = 60.0
+TUS_VERSION = '1.0.0'
+
+_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+@dataclass
+class UploadSession:
+    id: str
+    length: int
+    content_type: str
+    filename: str
+    expires_at: float
+    offset: int = 0
+
+
+def parse_metadata(value: str) -> Dict[str, str]:
+    # Upload-Metadata: "filename Zm90by5qcGc=,filetype aW1hZ2UvanBlZw==" (valors en base64)
+    metadata = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        key, _, encoded = item.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(encoded.strip(), validate=True).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Upload-Metadata invàlid: {key}')
+    return metadata
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Sessió de pujada inexistent o caducada')
+
+
+def _conflict(detail: str, offset: int) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail,
+                         headers={'Upload-Offset': str(offset), 'Tus-Resumable': TUS_VERSION})
+
+
+class ResumableUploads:
+    def __init__(self, directory: str = RESUMABLE_DIR, ttl: float = UPLOAD_SESSION_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.created = 0
+        self.completed = 0
+        self.expired = 0
+        self.bytes_received = 0
+        self._busy: set = set()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def _paths(self, upload_id: str) -> Tuple[str, str]:
+        # L'id ve de la URL: només hex, res de camins
+        if not _ID.match(upload_id):
+            raise _not_found()
+        base = os.path.join(self.directory, upload_id)
+        return base + '.part', base + '.json'
+
+    def create(self, length: int, content_type: str, filename: str) -> UploadSession:
+        if content_type not in ALLOW_MIME:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                detail='Invalid file type. Only jpg, jpeg, or png are allowed.')
+        if length > MAX_BYTES:
+            raise too_large()
+        if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+            self.purge_expired()
+
+        ensure_media_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        session = UploadSession(uuid.uuid4().hex, length, content_type, os.path.basename(filename or ''),
+                                time.time() + self.ttl)
+        part_path, meta_path = self._paths(session.id)
+        open(part_path, 'wb').close()
+        tmp = f'{meta_path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(asdict(session), f)
+        os.replace(tmp, meta_path)
+        self.created += 1
+        return session
+
+    def load(self, upload_id: str) -> UploadSession:
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                session = UploadSession(**json.load(f))
+            session.offset = os.path.getsize(part_path)
+        except FileNotFoundError:
+            raise _not_found()
+        if session.expires_at < time.time():
+            self._remove(upload_id)
+            self.expired += 1
+            raise _not_found()
+        return session
+
+    def _open(self, session: UploadSession) -> BinaryIO:
+        # Un sol escriptor per sessió: en aquest procés (_busy) i entre processos (flock)
+        with self._lock:
+            if session.id in self._busy:
+                raise _conflict('Aquesta pujada ja està rebent dades', session.offset)
+            self._busy.add(session.id)
+        try:
+            f = open(self._paths(session.id)[0], 'ab')
+        except FileNotFoundError:
+            self._release(session.id)
+            raise _not_found()
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._close(session.id, f)
+                raise _conflict('Aquesta pujada ja està rebent dades', session.offset)
+        return f
+
+    def _release(self, upload_id: str) -> None:
+        with self._lock:
+            self._busy.discard(upload_id)
+
+    def _close(self, upload_id: str, f: BinaryIO, sync: bool = False) -> None:
+        try:
+            if sync:
+                # L'offset que es respon ha de ser el que hi haurà després d'una caiguda
+                f.flush()
+                os.fsync(f.fileno())
+            f.close()
+        finally:
+            self._release(upload_id)
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        session = await run_in_threadpool(self.load, upload_id)
+        f = await run_in_threadpool(self._open, session)
+        try:
+            # Amb el bloqueig agafat la mida del fitxer és l'offset real
+            session.offset = os.fstat(f.fileno()).st_size
+            if offset != session.offset:
+                raise _conflict('Upload-Offset no coincideix amb el que ja s\'ha rebut', session.offset)
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if session.offset + len(chunk) > session.length:
+                    raise too_large()
+                await run_in_threadpool(f.write, chunk)
+                session.offset += len(chunk)
+                self.bytes_received += len(chunk)
+        finally:
+            # També si el client es desconnecta: el que ja ha arribat es conserva
+            await run_in_threadpool(self._close, upload_id, f, True)
+        return session
+
+    def finalize(self, upload_id: str) -> dict:
+        session = self.load(upload_id)
+        f = self._open(session)
+        try:
+            part_path, meta_path = self._paths(upload_id)
+            size = os.fstat(f.fileno()).st_size
+            if size != session.length:
+                raise _conflict('La pujada encara no és completa', size)
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as source:
+                while chunk := source.read(CHUNKS):
+                    digest.update(chunk)
+            try:
+                saved = store_file(part_path, digest.hexdigest(), size, session.content_type, session.filename)
+            finally:
+                os.remove(meta_path)
+        finally:
+            self._close(upload_id, f)
+        self.completed += 1
+        return saved
+
+    def delete(self, upload_id: str) -> None:
+        self.load(upload_id)
+        self._remove(upload_id)
+
+    def _remove(self, upload_id: str) -> None:
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self) -> int:
+        # Sessions caducades i .part que s'han quedat sense .json
+        self._last_purge = time.monotonic()
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        for name in names:
+            upload_id, ext = os.path.splitext(name)
+            if not _ID.match(upload_id) or upload_id in self._busy:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if ext == '.json':
+                    with open(path) as f:
+                        expired = json.load(f)['expires_at'] < now
+                elif ext == '.part':
+                    expired = (not os.path.exists(os.path.join(self.directory, upload_id + '.json'))
+                               and os.path.getmtime(path) + self.ttl < now)
+                else:
+                    continue
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+            if expired:
+                self._remove(upload_id)
+                removed += 1
+        self.expired += removed
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'created': self.created,
+            'completed': self.completed,
+            'expired': self.expired,
+            'receiving': len(self._busy),
+            'bytes_received': self.bytes_received,
+        }
+
+
+resumable_uploads = ResumableUploads()
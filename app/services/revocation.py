@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Engine, delete, event, insert, select
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session
+
+from app.models import RevokedTokenORM
+
+# Llista de tokens revocats (logout o credencials compromeses).
+# - Persistència: taula revoked_tokens amb el 'jti' i l''exp' de cada token.
+# - En memòria: array ordenat d'empremtes de 64 bits del jti (8 bytes per token) on es cerca amb
+#   bisect, de manera que get_current_user ho comprova sense tocar la base de dades.
+# - Cada procés llegeix només les files noves cada REVOCATION_REFRESH segons, en un sol fil de fons
+#   que dura tota la vida del procés.
+#   Les revocacions fetes pel mateix procés s'apliquen en confirmar la transacció.
+# - Les entrades es descarten (a memòria i a la taula) quan el token ja ha caducat.
+
+REVOCATION_REFRESH = float(os.getenv('REVOCATION_REFRESH', '2'))
+REVOCATION_GC_INTERVAL = float(os.getenv('REVOCATION_GC_INTERVAL', '3600'))
+# Ids que es tornen a llegir en cada refresc: amb PostgreSQL un id petit es pot confirmar després d'un de gran
+REFRESH_OVERLAP = 100
+
+_PENDING_KEY = 'revocation_pending'
+
+logger = logging.getLogger('app.auth')
+
+
+def fingerprint(jti: str) -> int:
+    return int.from_bytes(hashlib.blake2b(jti.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def to_timestamp(when: datetime) -> float:
+    # Les dates es guarden en UTC sense zona horària
+    return when.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RevocationList:
+    def __init__(self, refresh_interval: float = REVOCATION_REFRESH, gc_interval: float = REVOCATION_GC_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.gc_interval = gc_interval
+        self.hits = 0
+        self._fingerprints = array('Q')
+        self._expires: Dict[int, float] = {}
+        self._last_id = 0
+        self._collected_at = time.monotonic()
+        self._loader: Optional[Callable[[int], Iterable[Tuple[int, str, datetime]]]] = None
+        self._collector: Optional[Callable[[], int]] = None
+        self._refresher_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def is_revoked(self, jti: str) -> bool:
+        # Camí habitual (cap revocació que coincideixi): un hash i una cerca binària, sense bloqueig
+        fingerprints = self._fingerprints
+        if not fingerprints:
+            return False
+        value = fingerprint(jti)
+        position = bisect_left(fingerprints, value)
+        if position < len(fingerprints) and fingerprints[position] == value:
+            self.hits += 1
+            return True
+        return False
+
+    def add(self, entries: Iterable[Tuple[str, float]]) -> None:
+        # Afegeix (jti, exp) i de pas descarta les entrades caducades. L'array es reconstrueix i es
+        # substitueix sencer, així els lectors sempre en veuen un de complet.
+        with self._lock:
+            now = time.time()
+            expires = {value: exp for value, exp in self._expires.items() if exp > now}
+            for jti, exp in entries:
+                if exp > now:
+                    expires[fingerprint(jti)] = exp
+            self._expires = expires
+            self._fingerprints = array('Q', sorted(expires))
+
+    def set_source(self, loader: Callable[[int], Iterable[Tuple[int, str, datetime]]], collector: Callable[[], int]) -> None:
+        self._loader = loader
+        self._collector = collector
+
+    def sync(self) -> None:
+        rows = list(self._loader(max(0, self._last_id - REFRESH_OVERLAP)))
+        self.add((jti, to_timestamp(expires_at)) for _, jti, expires_at in rows)
+        if rows:
+            self._last_id = max(self._last_id, max(row_id for row_id, _, _ in rows))
+        if time.monotonic() - self._collected_at >= self.gc_interval:
+            self._collected_at = time.monotonic()
+            self._collector()
+            self.add(())
+
+    def refresh(self) -> None:
+        # Assegura que el fil de refresc d'aquest procés està en marxa (després d'un fork no hi és)
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid() or self._loader is None:
+                return
+            self._refresher_pid = os.getpid()
+        threading.Thread(target=self._refresh_periodically, name='revocation-refresh', daemon=True).start()
+
+    def _refresh_periodically(self) -> None:
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.sync()
+            except Exception:
+                # Si la base de dades falla es torna a provar a l'interval següent
+                logger.exception('revocation refresh failed')
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._fingerprints), 'last_id': self._last_id, 'hits': self.hits}
+
+
+revocations = RevocationList()
+
+
+def revoke(db: Session, jti: str, expires_at: datetime) -> None:
+    # Revoca un token fins al seu 'exp'. Si ja hi era no fa res.
+    row = {'jti': jti, 'expires_at': expires_at}
+    dialect = db.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(RevokedTokenORM)
+        db.execute(stmt.on_conflict_do_nothing(index_elements=['jti']), row)
+    elif db.scalar(select(RevokedTokenORM.id).where(RevokedTokenORM.jti == jti)) is None:
+        db.execute(insert(RevokedTokenORM), row)
+    db.info.setdefault(_PENDING_KEY, []).append((jti, to_timestamp(expires_at)))
+
+
+def collect_garbage(db: Session) -> int:
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return db.execute(delete(RevokedTokenORM).where(RevokedTokenORM.expires_at < now)).rowcount
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_after_commit(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        revocations.add(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def install_revocations(engine: Engine) -> None:
+    def load_rows(after_id: int) -> List[Tuple[int, str, datetime]]:
+        with Session(engine) as session:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            rows = session.execute(
+                select(RevokedTokenORM.id, RevokedTokenORM.jti, RevokedTokenORM.expires_at)
+                .where(RevokedTokenORM.id > after_id, RevokedTokenORM.expires_at >= now)
+                .order_by(RevokedTokenORM.id)
+            )
+            return [tuple(row) for row in rows]
+
+    def collect() -> int:
+        with Session(engine) as session:
+            deleted = collect_garbage(session)
+            session.commit()
+            return deleted
+
+    revocations.set_source(load_rows, collect)
+    revocations.sync()
+    revocations.refresh()
+
+
+if __name__ == '__main__':
+    # python -m app.services.revocation gc | revoke <token>
+    import jwt
+    from app.core.db import SessionLocal
+    from app.core.security import SECRET_KEY, ALGORITHM
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'gc'
+    if command not in ('gc', 'revoke') or (command == 'revoke' and len(sys.argv) < 3):
+        sys.exit('Ús: python -m app.services.revocation [gc | revoke <token>]')
+    with SessionLocal() as session:
+        if command == 'gc':
+            print(f'gc: {collect_garbage(session)} tokens caducats esborrats')
+        else:
+            payload = jwt.decode(sys.argv[2], key=SECRET_KEY, algorithms=[ALGORITHM], options={'verify_exp': False})
+            if not payload.get('jti'):
+                sys.exit('El token no té jti: no es pot revocar, caducarà sol')
+            revoke(session, payload['jti'], datetime.fromtimestamp(payload['exp'], tz=timezone.utc).replace(tzinfo=None))
+            print(f"revocat: {payload['jti']}")
+        session.commit()
@@ -0,0 +1,40 @@
+import json
+from functools import lru_cache
+from typing import Any
+
+from pydantic import TypeAdapter
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson és opcional: sense ell es fa servir json
+    orjson = None
+
+# Camí ràpid de serialització per als endpoints més usats.
+# Cada tipus de resposta té un TypeAdapter precompilat (es construeix un sol cop), els objectes ORM
+# es validen una única vegada i es bolquen directament a bytes JSON. L'endpoint retorna una
+# FastJSONResponse amb aquests bytes, de manera que FastAPI no torna a validar amb response_model.
+
+
+@lru_cache(maxsize=None)
+def adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def dump_json(schema: Any, value: Any, exclude_none: bool = False) -> bytes:
+    type_adapter = adapter(schema)
+    return type_adapter.dump_json(type_adapter.validate_python(value, from_attributes=True), exclude_none=exclude_none)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    # Accepta bytes ja serialitzats (es retornen tal qual) o dades Python (orjson si està instal·lat)
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
@@ -0,0 +1,68 @@
+from sqlalchemy import Connection, Engine, inspect, text
+
+# Comptador desnormalitzat de posts per etiqueta (tags.post_count).
+# Es manté amb triggers sobre post_tags, de manera que qualsevol camí d'escriptura (ORM, inserció
+# massiva amb Core, esborrats en cascada) l'actualitza dins la mateixa transacció.
+# - SQLite: triggers AFTER INSERT / DELETE / UPDATE.
+# - PostgreSQL: funció plpgsql + trigger per fila.
+# - Altres motors: no hi ha manteniment automàtic; recount_tags() el recalcula.
+
+_SQLITE_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS post_tags_count_ai AFTER INSERT ON post_tags BEGIN
+        UPDATE tags SET post_count = post_count + 1 WHERE id = new.tag_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_tags_count_ad AFTER DELETE ON post_tags BEGIN
+        UPDATE tags SET post_count = post_count - 1 WHERE id = old.tag_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_tags_count_au AFTER UPDATE OF tag_id ON post_tags BEGIN
+        UPDATE tags SET post_count = post_count - 1 WHERE id = old.tag_id;
+        UPDATE tags SET post_count = post_count + 1 WHERE id = new.tag_id;
+    END""",
+]
+
+_POSTGRES_DDL = [
+    """CREATE OR REPLACE FUNCTION post_tags_count() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE tags SET post_count = post_count - 1 WHERE id = OLD.tag_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE tags SET post_count = post_count + 1 WHERE id = NEW.tag_id;
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS post_tags_count ON post_tags",
+    """CREATE TRIGGER post_tags_count AFTER INSERT OR DELETE OR UPDATE OF tag_id ON post_tags
+        FOR EACH ROW EXECUTE FUNCTION post_tags_count()""",
+]
+
+
+def recount_tags(conn: Connection) -> None:
+    # Recalcula tots els comptadors a partir de post_tags (instal·lació inicial o reparació)
+    conn.execute(text(
+        "UPDATE tags SET post_count = (SELECT count(*) FROM post_tags WHERE post_tags.tag_id = tags.id)"
+    ))
+
+
+def install_tag_counts(engine: Engine) -> None:
+    with engine.begin() as conn:
+        # Bases de dades creades abans d'existir la columna (create_all no altera taules existents)
+        if 'post_count' not in {col['name'] for col in inspect(conn).get_columns('tags')}:
+            conn.execute(text('ALTER TABLE tags ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tags_post_count_id ON tags (post_count, id)'))
+
+        if engine.dialect.name == 'sqlite':
+            installed = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'post_tags_count_ai'")
+            ).first()
+            ddl = _SQLITE_DDL
+        elif engine.dialect.name == 'postgresql':
+            installed = conn.execute(text("SELECT 1 FROM pg_trigger WHERE tgname = 'post_tags_count'")).first()
+            ddl = _POSTGRES_DDL
+        else:
+            return
+
+        for statement in ddl:
+            conn.execute(text(statement))
+        if not installed:
+            recount_tags(conn)
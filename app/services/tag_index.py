@@ -0,0 +1,222 @@
+import heapq
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Engine, event, select
+from sqlalchemy.orm import Session
+
+from app.models import TagORM
+
+# Índex de prefixos en memòria per a l'autocompletat d'etiquetes.
+# Llista ordenada de (nom en minúscules, id) on es cerca el rang del prefix amb bisect, i el
+# nombre d'usos de cada etiqueta per ordenar els suggeriments. Per als prefixos amb molts
+# candidats (p. ex. una sola lletra) el top es guarda a part i s'actualitza quan una etiqueta
+# que hi comença guanya usos (o es recalcula si en perd). Els canvis s'apliquen quan la sessió fa commit; com que cada procés
+# té el seu índex, es recarga sencer cada TAG_INDEX_TTL segons per recollir canvis d'altres processos.
+# Les etiquetes que canvien incrementalment mentre la recàrrega llegeix la base de dades es
+# queden amb el valor de memòria (que ja inclou el canvi) en comptes del llegit, que potser no el té.
+
+TAG_INDEX_TTL = float(os.getenv('TAG_INDEX_TTL', '300'))
+SUGGEST_MAX_K = 50
+SCAN_LIMIT = 256  # amb més candidats que això el top del prefix es guarda en memòria cau
+TOP_CACHE_SIZE = 10_000
+PREWARM_LENGTH = 2
+
+_PENDING_KEY = 'tag_index_pending'
+_END = '\U0010ffff'
+
+
+class TagIndex:
+    def __init__(self, ttl: float = TAG_INDEX_TTL):
+        self.ttl = ttl
+        self._keys: List[Tuple[str, int]] = []
+        self._tags: Dict[int, Tuple[str, int]] = {}
+        self._top: Dict[str, List[int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._loader: Optional[Callable[[], Iterable[Tuple[int, str, int]]]] = None
+        self._reloading = False
+        self._touched: Optional[set] = None  # etiquetes canviades durant la recàrrega en curs
+        self.merged_tags = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._loaded_at is not None
+
+    def load(self, rows: Iterable[Tuple[int, str, int]]) -> None:
+        tags = {tag_id: (name, uses or 0) for tag_id, name, uses in rows}
+        keys = sorted((name.lower(), tag_id) for tag_id, (name, _) in tags.items())
+        top = {}
+        # Els prefixos curts són els més demanats i els més cars de calcular: es preparen ara
+        for length in range(1, PREWARM_LENGTH + 1):
+            for prefix in {name[:length] for name, _ in keys if len(name) >= length}:
+                lo, hi = self._range(keys, prefix)
+                if hi - lo > SCAN_LIMIT:
+                    top[prefix] = self._best(tags, keys[lo:hi], SUGGEST_MAX_K)
+        with self._lock:
+            live = {tag_id: self._tags.get(tag_id) for tag_id in self._touched or ()}
+            self._touched = None
+            self._tags, self._keys, self._top = tags, keys, top
+            for tag_id, value in live.items():
+                self._replace(tag_id, value)
+            self.merged_tags += len(live)
+            self._loaded_at = time.monotonic()
+
+    def set_loader(self, loader: Callable[[], Iterable[Tuple[int, str, int]]]) -> None:
+        self._loader = loader
+
+    def refresh(self) -> None:
+        # Recàrrega en un fil a part si l'índex és fred o ha caducat: mentrestant es serveix el que hi ha
+        with self._lock:
+            fresh = self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+            if fresh or self._reloading or self._loader is None:
+                return
+            self._reloading = True
+            self._touched = set()
+
+        def reload():
+            try:
+                self.load(self._loader())
+            finally:
+                with self._lock:
+                    self._touched = None
+                self._reloading = False
+
+        threading.Thread(target=reload, name='tag-index-reload', daemon=True).start()
+
+    def suggest(self, prefix: str, k: int = 10) -> List[dict]:
+        prefix = prefix.strip().lower()
+        k = min(k, SUGGEST_MAX_K)
+        with self._lock:
+            ids = self._top.get(prefix)
+            if ids is None:
+                lo, hi = self._range(self._keys, prefix)
+                if hi - lo > SCAN_LIMIT:
+                    if len(self._top) >= TOP_CACHE_SIZE:
+                        self._top.clear()
+                    ids = self._top[prefix] = self._best(self._tags, self._keys[lo:hi], SUGGEST_MAX_K)
+                else:
+                    ids = self._best(self._tags, self._keys[lo:hi], k)
+            return [{'id': tag_id, 'name': self._tags[tag_id][0], 'post_count': self._tags[tag_id][1]} for tag_id in ids[:k]]
+
+    def upsert(self, tag_id: int, name: str, uses: Optional[int] = None) -> None:
+        with self._lock:
+            self._touch(tag_id)
+            previous = self._tags.get(tag_id)
+            self._replace(tag_id, (name, uses if uses is not None else (previous[1] if previous else 0)))
+
+    def remove(self, tag_id: int) -> None:
+        with self._lock:
+            self._touch(tag_id)
+            self._replace(tag_id, None)
+
+    def add_uses(self, tag_id: int, delta: int) -> None:
+        with self._lock:
+            current = self._tags.get(tag_id)
+            if current is None:
+                return
+            self._touch(tag_id)
+            self._tags[tag_id] = (current[0], max(0, current[1] + delta))
+            if delta > 0:
+                self._promote(tag_id)
+            else:
+                self._forget(current[0], tag_id)
+
+    def _touch(self, tag_id: int) -> None:
+        if self._touched is not None:
+            self._touched.add(tag_id)
+
+    def _replace(self, tag_id: int, value: Optional[Tuple[str, int]]) -> None:
+        # Substitueix (o esborra, amb None) una etiqueta mantenint les claus i els tops guardats
+        previous = self._tags.pop(tag_id, None)
+        if previous is not None:
+            self._remove_key(previous[0], tag_id)
+        if value is not None:
+            self._tags[tag_id] = value
+            insort(self._keys, (value[0].lower(), tag_id))
+            self._promote(tag_id)
+
+    @staticmethod
+    def _range(keys: List[Tuple[str, int]], prefix: str) -> Tuple[int, int]:
+        return bisect_left(keys, (prefix,)), bisect_left(keys, (prefix + _END,))
+
+    @staticmethod
+    def _best(tags: Dict[int, Tuple[str, int]], candidates: List[Tuple[str, int]], limit: int) -> List[int]:
+        # Més usos primer; a igualtat, per nom
+        return [tag_id for _, tag_id in heapq.nsmallest(limit, candidates, key=lambda key: (-tags[key[1]][1], key))]
+
+    def _sort_key(self, tag_id: int) -> Tuple[int, Tuple[str, int]]:
+        name, uses = self._tags[tag_id]
+        return -uses, (name.lower(), tag_id)
+
+    def _promote(self, tag_id: int) -> None:
+        # L'etiqueta ha guanyat posicions (o és nova): s'actualitzen els tops guardats dels seus prefixos
+        lowered = self._tags[tag_id][0].lower()
+        key = self._sort_key(tag_id)
+        for length in range(len(lowered) + 1):
+            ids = self._top.get(lowered[:length])
+            if ids is None:
+                continue
+            if tag_id not in ids:
+                if key >= self._sort_key(ids[-1]):
+                    continue
+                ids.append(tag_id)
+            ids.sort(key=self._sort_key)
+            del ids[SUGGEST_MAX_K:]
+
+    def _forget(self, name: str, tag_id: int) -> None:
+        # L'etiqueta ha perdut posicions o ja no hi és: el següent candidat és desconegut i el top es recalcula
+        lowered = name.lower()
+        for length in range(len(lowered) + 1):
+            ids = self._top.get(lowered[:length])
+            if ids is not None and tag_id in ids:
+                del self._top[lowered[:length]]
+
+    def _remove_key(self, name: str, tag_id: int) -> None:
+        position = bisect_left(self._keys, (name.lower(), tag_id))
+        if position < len(self._keys) and self._keys[position] == (name.lower(), tag_id):
+            del self._keys[position]
+        self._forget(name, tag_id)
+
+
+tag_index = TagIndex()
+
+
+def install_tag_index(engine: Engine) -> None:
+    def load_rows() -> List[Tuple[int, str, int]]:
+        with Session(engine) as session:
+            return [tuple(row) for row in session.execute(select(TagORM.id, TagORM.name, TagORM.post_count))]
+
+    tag_index.set_loader(load_rows)
+    tag_index.load(load_rows())
+
+
+def suggest_from_db(db: Session, prefix: str, k: int) -> List[dict]:
+    # Alternativa mentre l'índex no està carregat
+    pattern = prefix.strip().lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    rows = db.execute(
+        select(TagORM.id, TagORM.name, TagORM.post_count)
+        .where(TagORM.name.ilike(pattern, escape='\\'))
+        .order_by(TagORM.post_count.desc(), TagORM.name.asc())
+        .limit(k)
+    ).mappings()
+    return [dict(row) for row in rows]
+
+
+def index_on_commit(db: Session, method: str, *args) -> None:
+    # Els canvis a l'índex només s'apliquen si la transacció es confirma
+    db.info.setdefault(_PENDING_KEY, []).append((method, args))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_after_commit(session: Session) -> None:
+    for method, args in session.info.pop(_PENDING_KEY, ()):
+        getattr(tag_index, method)(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
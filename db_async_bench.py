@@ -0,0 +1,127 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+# Prova de càrrega del mode síncron (threadpool) contra el mode asíncron (DB_ASYNC=true, run_sync
+# sobre aiosqlite) amb 500 clients simultanis contra un uvicorn real per mode.
+# - Base de dades SQLite temporal amb POSTS posts i TAGS etiquetes; els dos servidors fan servir la mateixa.
+# - Cada client repeteix GET /posts/by_tags (una etiqueta diferent cada vegada) durant DURATION segons.
+# - Es mostren peticions per segon, latència p50/p99 i errors per tipus (timeouts, connexions tancades, 5xx).
+# Ús: python db_async_bench.py [clients] [segons]
+#
+# Resultat en un entorn d'1 CPU (client i servidor a la mateixa CPU, SQLite), dues execucions:
+#   sync   32-38 req/s   p50 10-11 s   p99 23-26 s
+#   async  33 req/s      p50 12-13 s   p99 26-27 s
+# Cap diferència apreciable: amb una sola CPU el límit és la CPU (serialització i el mateix client),
+# no les esperes a la base de dades, i aiosqlite també fa servir un fil per connexió. El mode
+# asíncron està pensat per a bases de dades de xarxa (asyncpg), que aquí no es mesuren.
+
+CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+DURATION = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+POSTS = 5000
+TAGS = 500
+# Sense memòria cau de respostes: cada petició és una consulta (posts + etiquetes + autor, ~20 posts)
+PATHS = [f'/posts/by_tags?tags=etiqueta{i}' for i in range(TAGS)]
+
+
+def populate(url: str) -> None:
+    os.environ['DATABASE_URL'] = url
+    from app.core.db import Base
+    from app.api.v1.posts.repository import PostRepository
+
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        repository = PostRepository(db)
+        for start in range(0, POSTS, 500):
+            repository.bulk_create_posts([
+                {'title': f'Post {i}', 'content': f'Contingut del post {i}',
+                 'tags': [f'etiqueta{i % TAGS}', f'etiqueta{(i * 7) % TAGS}']}
+                for i in range(start, start + 500)
+            ], author={'username': 'bench', 'email': 'bench@example.com'})
+            db.commit()
+    engine.dispose()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(base_url: str) -> None:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(200):
+            try:
+                await client.get('/')
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f'{base_url} no respon')
+
+
+async def load(base_url: str):
+    latencies, errors = [], {}
+    deadline = time.perf_counter() + DURATION
+    limits = httpx.Limits(max_connections=CLIENTS, max_keepalive_connections=CLIENTS)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        async def client(i):
+            n = i
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await http.get(PATHS[n % len(PATHS)])
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError as exc:
+                    errors[type(exc).__name__] = errors.get(type(exc).__name__, 0) + 1
+                n += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(CLIENTS)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    if not latencies:
+        return 0.0, 0.0, 0.0, errors
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1e3,
+            latencies[int(len(latencies) * 0.99)] * 1e3, errors)
+
+
+def run(mode: str, url: str):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=url, DB_ASYNC='true' if mode == 'async' else 'false',
+               RATE_LIMIT_ENABLED='false', MEDIA_SWEEP_INTERVAL='0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning',
+         '--backlog', str(CLIENTS * 2)],
+        env=env,
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        asyncio.run(wait_ready(base_url))
+        return asyncio.run(load(base_url))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'db_async_bench.db')
+    url = f'sqlite:///{path}'
+    populate(url)
+    print(f'{CLIENTS} clients, {DURATION:.0f} s per mode, {POSTS} posts ({path}), {os.cpu_count()} CPU')
+    for mode in ('sync', 'async'):
+        rate, p50, p99, errors = run(mode, url)
+        print(f'{mode:<6} {rate:8.1f} req/s   p50 {p50:8.1f} ms   p99 {p99:8.1f} ms   errors {errors or 0}')
+
+
+if __name__ == '__main__':
+    main()
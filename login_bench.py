@@ -0,0 +1,89 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.main import app
+from app.api.v1.auth import router as auth_router
+from app.api.v1.auth.repository import UserRepository
+from app.core.db import SessionLocal
+from app.services import passwords
+
+# Rendiment del login amb 200 peticions simultànies d'usuaris diferents:
+# - hash calculat dins del bucle d'esdeveniments (com seria una crida directa a verify_password)
+# - hash calculat al pool acotat (verify_password_async)
+# Mentrestant es mesura el retard del bucle (quant tarda a despertar un sleep de 5 ms), que és el
+# que notarien la resta de peticions. Al final, una ràfega amb la mateixa contrasenya errònia
+# mostra l'efecte del single-flight i de la memòria d'errors recents.
+# Ús: python login_bench.py
+
+LOGINS = 200
+URL = '/api/v1/auth/login'
+TICK = 0.005
+USERS = [{'username': f'bench{i}@example.com', 'password': f'contrasenya-{i}'} for i in range(LOGINS)]
+
+
+def seed_users():
+    with SessionLocal() as db:
+        repository = UserRepository(db)
+        for user in USERS:
+            if repository.get_by_email(user['username']) is None:
+                repository.create_user(user['username'], 'bench', passwords.hash_password(user['password']))
+        db.commit()
+
+
+async def inline_verify(password: str, encoded: str) -> bool:
+    return passwords.verify_password(password, encoded)
+
+
+async def probe(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def storm(client: httpx.AsyncClient, credentials: list, expected: int):
+    stop, lags = asyncio.Event(), []
+    prober = asyncio.create_task(probe(stop, lags))
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(client.post(URL, data=data) for data in credentials))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await prober
+    assert all(response.status_code == expected for response in responses)
+    lags.sort()
+    return LOGINS / elapsed, lags[len(lags) // 2] * 1e3, lags[int(len(lags) * 0.99)] * 1e3, max(lags) * 1e3
+
+
+def report(label, result):
+    rate, p50, p99, worst = result
+    print(f'{label:<34} {rate:7.1f} logins/s   retard del bucle p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  màx {worst:7.1f} ms')
+
+
+async def main():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        await client.post(URL, data=USERS[0])  # escalfament
+
+        auth_router.verify_password_async = inline_verify
+        report('hash al bucle', await storm(client, USERS, 200))
+        auth_router.verify_password_async = passwords.verify_password_async
+        report(f'hash al pool ({passwords.PASSWORD_HASH_WORKERS} treballadors)', await storm(client, USERS, 200))
+
+        wrong = [dict(USERS[0], password='incorrecta')] * LOGINS
+        report('mateixa contrasenya errònia', await storm(client, wrong, 401))
+    print(passwords.stats())
+    print(f'cost d\'un hash: {statistics.median(timed() for _ in range(5)) * 1e3:.1f} ms')
+
+
+def timed() -> float:
+    start = time.perf_counter()
+    passwords.verify_password('123456', passwords.DUMMY_HASH)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    seed_users()
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+
+from app.api.v1.media import router as media
+
+# 1000 peticions simultànies d'imatges petites (8 KB, 50 fitxers diferents):
+# el muntatge StaticFiles d'abans contra el router de /media (LRU en memòria + ETag + immutable),
+# i el cas d'un navegador que revalida amb If-None-Match (304).
+# S'executa dins del procés amb ASGITransport, sense xarxa.
+# Ús: python media_bench.py
+
+FILES = 50
+SIZE = 8 * 1024
+REQUESTS = 1000
+ROUNDS = 5
+
+
+def build_apps(directory: str):
+    static = FastAPI()
+    static.mount('/media', StaticFiles(directory=directory), name='media')
+    media.MEDIA_ROOT = os.path.realpath(directory)
+    served = FastAPI()
+    served.include_router(media.router)
+    return static, served
+
+
+async def storm(app: FastAPI, names, revalidate: dict = None) -> float:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        async def fetch(i):
+            name = names[i % len(names)]
+            headers = {'If-None-Match': revalidate[name]} if revalidate else {}
+            response = await client.get(f'/media/{name}', headers=headers)
+            assert response.status_code == (304 if revalidate else 200)
+            return response
+
+        best = float('inf')
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            await asyncio.gather(*(fetch(i) for i in range(REQUESTS)))
+            best = min(best, time.perf_counter() - start)
+        return REQUESTS / best
+
+
+async def main():
+    directory = tempfile.mkdtemp()
+    try:
+        names = []
+        for i in range(FILES):
+            name = f'{os.urandom(16).hex()}.png'
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(os.urandom(SIZE))
+            names.append(name)
+        static, served = build_apps(directory)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=served), base_url='http://bench') as client:
+            etags = {name: (await client.get(f'/media/{name}')).headers['etag'] for name in names}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=static), base_url='http://bench') as client:
+            static_etags = {name: (await client.get(f'/media/{name}')).headers['etag'] for name in names}
+
+        print(f'StaticFiles                 {await storm(static, names):8.0f} peticions/s')
+        print(f'router /media (LRU)         {await storm(served, names):8.0f} peticions/s')
+        print(f'StaticFiles, If-None-Match  {await storm(static, names, static_etags):8.0f} peticions/s')
+        print(f'router /media, If-None-Match{await storm(served, names, etags):8.0f} peticions/s')
+        print(media.media_server.stats())
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.db import Base
+from app.models import PostORM
+from app.services.full_text import apply_full_text, install_full_text_search
+
+# Cerca de posts amb LIKE '%terme%' (el que feia GET /posts?search=) contra l'índex de text complet
+# (FTS5 a SQLite, vegeu app/services/full_text.py) sobre una base de dades nova de N posts.
+# Per a cada cerca es mesura la primera pàgina (20 resultats) i el total, com fa el llistat.
+# Ús: python search_bench.py [posts]   (per defecte 1.000.000; la càrrega inicial tarda una estona)
+
+POSTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+PER_PAGE = 20
+ROUNDS = 5
+BATCH = 10_000
+WORDS = [f'paraula{i}' for i in range(5000)] + ['python', 'fastapi', 'sqlalchemy', 'pydantic', 'docker']
+QUERIES = ['python', 'fastapi sqlalchemy', 'paraula4321', 'inexistent']
+
+
+def populate(engine) -> None:
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for start in range(0, POSTS, BATCH):
+            rows = [
+                {'title': f'Post {i} ' + ' '.join(rng.choices(WORDS, k=4)),
+                 'content': ' '.join(rng.choices(WORDS, k=60))}
+                for i in range(start, min(start + BATCH, POSTS))
+            ]
+            conn.execute(PostORM.__table__.insert(), rows)
+
+
+def like_search(db: Session, query: str):
+    pattern = f'%{query}%'
+    results = select(PostORM.id).where(or_(PostORM.title.like(pattern), PostORM.content.like(pattern)))
+    page = db.execute(results.order_by(PostORM.id).limit(PER_PAGE)).all()
+    total = db.execute(select(func.count()).select_from(results.subquery())).scalar_one()
+    return page, total
+
+
+def fts_search(db: Session, query: str):
+    results, rank = apply_full_text(db, select(PostORM.id), query)
+    page = db.execute(results.order_by(rank, PostORM.id).limit(PER_PAGE)).all()
+    total = db.execute(select(func.count()).select_from(results.subquery())).scalar_one()
+    return page, total
+
+
+def measure(db: Session, search, query: str):
+    best = float('inf')
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        _, total = search(db, query)
+        best = min(best, time.perf_counter() - start)
+    return best, total
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'search_bench.db')
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    install_full_text_search(engine)
+
+    start = time.perf_counter()
+    populate(engine)
+    print(f'{POSTS} posts carregats en {time.perf_counter() - start:.1f} s ({path})')
+
+    print(f'{"cerca":<22} {"LIKE":>10} {"FTS":>10} {"x":>7} {"resultats":>10}')
+    with Session(engine) as db:
+        for query in QUERIES:
+            like, like_total = measure(db, like_search, query)
+            fts, fts_total = measure(db, fts_search, query)
+            # LIKE troba subcadenes (p. ex. 'paraula4321' dins de 'paraula43210'): els totals poden diferir
+            print(f'{query:<22} {like * 1000:8.1f}ms {fts * 1000:8.1f}ms {like / fts:6.1f}x {fts_total:>10}'
+                  f'{"" if like_total == fts_total else f" (LIKE: {like_total})"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import json
+import timeit
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.api.v1.posts.schemas import PaginatedPosts, PaginatedPostSummaries
+from app.api.v1.tags.schemas import PaginatedTags
+from app.models import PostORM, TagORM, AuthorORM
+from app.services.serialization import dump_json
+
+# Microbenchmark del cost de serialització per element amb pàgines de 50 elements:
+# camí antic (model Pydantic per element + response_model de FastAPI, que torna a validar)
+# contra el camí ràpid (TypeAdapter precompilat, una sola validació i volcat directe a bytes).
+# Ús: python serialization_bench.py
+
+PAGE_SIZE = 50
+ROUNDS = 200
+
+author = AuthorORM(id=1, name='Eduard', email='eduard@example.com')
+tags = [TagORM(id=1, name='python'), TagORM(id=2, name='fastapi')]
+posts = [
+    PostORM(id=i, title=f'Post número {i}', content='Contingut del post ' * 20, author=author, tags=tags)
+    for i in range(1, PAGE_SIZE + 1)
+]
+envelope = dict(page=1, per_page=PAGE_SIZE, total=1000, total_exact=True, total_pages=20,
+                has_prev=False, has_next=True, order_by='id', direction='asc', search=None)
+tag_envelope = dict(total=100, total_exact=True, pages=2, page=1, per_page=PAGE_SIZE)
+tag_items = [TagORM(id=i, name=f'etiqueta-{i}') for i in range(1, PAGE_SIZE + 1)]
+
+
+async def legacy(field, content):
+    # El que feia FastAPI amb response_model: tornar a validar el model retornat i serialitzar-lo amb json
+    data = await serialize_response(field=field, response_content=content)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def run(name, func):
+    seconds = timeit.timeit(func, number=ROUNDS) / ROUNDS
+    print(f'{name:<48} {seconds * 1e6 / PAGE_SIZE:8.1f} µs/element')
+
+
+def main():
+    import asyncio
+    loop = asyncio.new_event_loop()
+    fields = {schema: create_model_field('response', schema) for schema in (PaginatedPosts, PaginatedPostSummaries)}
+
+    def legacy_posts(schema):
+        page = schema(**envelope, items=posts)
+        return loop.run_until_complete(legacy(fields[schema], page))
+
+    def legacy_tags():
+        from app.api.v1.tags.schemas import TagPublic
+        result = dict(tag_envelope, items=[TagPublic.model_validate(tag) for tag in tag_items])
+        return json.dumps(jsonable_encoder(result)).encode('utf-8')
+
+    run('posts (PostPublic) response_model', lambda: legacy_posts(PaginatedPosts))
+    run('posts (PostPublic) TypeAdapter', lambda: dump_json(PaginatedPosts, dict(envelope, items=posts)))
+    run('posts (PostSummary) response_model', lambda: legacy_posts(PaginatedPostSummaries))
+    run('posts (PostSummary) TypeAdapter', lambda: dump_json(PaginatedPostSummaries, dict(envelope, items=posts)))
+    run('tags (TagPublic) dict + jsonable_encoder', legacy_tags)
+    run('tags (TagPublic) TypeAdapter', lambda: dump_json(PaginatedTags, dict(tag_envelope, items=tag_items)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  (registra totes les taules a Base.metadata)
+from app.core.db import Base
+from app.services.counting import count_cache
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def reset(self) -> None:
+        self.statements.clear()
+
+
+@pytest.fixture
+def engine():
+    # SQLite en memòria compartida per totes les connexions del test
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    count_cache.clear()
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def queries(engine):
+    return QueryCounter(engine)
+
+
+@pytest.fixture
+def media(engine, tmp_path, monkeypatch):
+    # Pujades i /media dins d'un directori temporal, sobre la base de dades del test i sense sweeper de fons
+    from app.api.v1.media import router as media_router
+    from app.services import media_blobs
+    from app.services.image_derivatives import derivatives
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(media_blobs, 'MEDIA_SWEEP_INTERVAL', 0)
+    monkeypatch.setattr(media_router, 'MEDIA_ROOT', str(tmp_path / 'app' / 'media'))
+    monkeypatch.setattr(derivatives, 'available', False)
+    media_blobs.install_media_blobs(engine, 'app/media')
+    yield tmp_path / 'app' / 'media'
+    media_blobs._engine = media_blobs.default_engine
+
+
+@pytest.fixture
+def api_client(engine):
+    # TestClient amb els routers donats sobre la base de dades del test i un usuari fix
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.core.db import get_db
+    from app.core.security import get_current_user
+    from app.services import response_cache
+
+    def test_db():
+        with Session(engine) as session:
+            yield session
+
+    def build(*routers, prefix: str = '') -> TestClient:
+        response_cache.response_cache.clear()
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router, prefix=prefix)
+        app.dependency_overrides[get_db] = test_db
+        app.dependency_overrides[get_current_user] = lambda: {'email': 'alumno@example.com', 'username': 'alumno'}
+        count_cache.clear()
+        return TestClient(app)
+
+    return build
+
+
+@pytest.fixture
+def posts_client(api_client):
+    from app.api.v1.posts.router import router as posts_router
+
+    return api_client(posts_router)
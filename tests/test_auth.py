@@ -0,0 +1,26 @@
+from sqlalchemy.orm import Session
+
+from app.api.v1.auth.repository import UserRepository
+from app.api.v1.auth.router import router as auth_router
+from app.core.security import decode_token
+from app.services import passwords
+
+
+def test_login_rehash_builds_the_token_without_reloading_the_user(api_client, engine, queries, monkeypatch):
+    # Hash amb paràmetres antics: el login el torna a calcular i fa commit
+    monkeypatch.setattr(passwords, 'PASSWORD_SCRYPT_N', 2 ** 10)
+    with Session(engine) as session:
+        UserRepository(session).create_user('alumno@example.com', 'alumno', passwords.hash_password('123456'))
+        session.commit()
+    monkeypatch.setattr(passwords, 'PASSWORD_SCRYPT_N', 2 ** 11)
+    client = api_client(auth_router, prefix='/api/v1')
+
+    queries.reset()
+    response = client.post('/api/v1/auth/login', data={'username': 'alumno@example.com', 'password': '123456'})
+    assert response.status_code == 200
+    # SELECT de l'usuari i UPDATE del hash; cap refresc de l'usuari expirat pel commit
+    assert [statement.split()[0] for statement in queries.statements] == ['SELECT', 'UPDATE']
+    assert decode_token(response.json()['access_token'])['username'] == 'alumno'
+
+    with Session(engine) as session:
+        assert not passwords.needs_rehash(UserRepository(session).get_by_email('alumno@example.com').password_hash)
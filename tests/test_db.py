@@ -0,0 +1,71 @@
+import asyncio
+from typing import List
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.api.v1.posts.repository import PostRepository
+from app.api.v1.posts.schemas import PostPublic
+from app.core.db import Base, run_db
+from app.services.serialization import dump_json
+from conftest import QueryCounter
+
+
+def seed(session: Session) -> None:
+    PostRepository(session).bulk_create_posts(
+        [{'title': f'Post {i:02d}', 'content': 'Contingut del post', 'tags': ['python', f'etiqueta{i % 3}']}
+         for i in range(20)],
+        author={'username': 'alumno', 'email': 'alumno@example.com'},
+    )
+    session.commit()
+
+
+def by_tags(session: Session) -> bytes:
+    # Com l'endpoint: la serialització es fa dins de la crida, sense càrregues mandroses fora
+    return dump_json(List[PostPublic], PostRepository(session).by_tags(['python']))
+
+
+def test_async_sessions_run_the_same_queries_as_sync(db, queries):
+    seed(db)
+    queries.reset()
+    expected = asyncio.run(run_db(db, by_tags))
+    sync_statements = list(queries.statements)
+
+    async def run_async():
+        engine = create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async_queries = QueryCounter(engine.sync_engine)
+        async with AsyncSession(engine) as session:
+            await session.run_sync(seed)
+            async_queries.reset()
+            body = await run_db(session, by_tags)
+        await engine.dispose()
+        return body, async_queries.statements
+
+    body, async_statements = asyncio.run(run_async())
+    assert body == expected
+    assert async_statements == sync_statements
+    assert len(async_statements) == 2  # posts amb autor (joinedload) + etiquetes (selectin)
+
+
+def test_engine_factory_adds_no_statements_per_checkout(tmp_path):
+    from sqlalchemy import text
+
+    from app.core.engine import SQLITE_PRAGMAS, create_db_engine, pool_stats
+
+    engine = create_db_engine(f'sqlite:///{tmp_path / "blog.db"}')
+    queries = QueryCounter(engine)
+    for _ in range(10):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    # Els PRAGMA s'apliquen un cop per connexió nova i el pre-ping no passa per aquí
+    assert queries.count == 10
+    stats = pool_stats(engine)
+    assert (stats['checkouts'], stats['checked_in']) == (10, 1)
+
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == SQLITE_PRAGMAS['journal_mode'].lower()
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == SQLITE_PRAGMAS['busy_timeout']
+    engine.dispose()
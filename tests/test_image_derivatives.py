@@ -0,0 +1,36 @@
+import asyncio
+import hashlib
+
+from app.services import image_derivatives
+from app.services.image_derivatives import DerivativePipeline
+
+
+def test_source_hash_memo_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_derivatives, 'SOURCE_HASH_CACHE_SIZE', 2)
+    pipeline = DerivativePipeline()
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'{i:032x}.png'
+        path.write_bytes(b'imatge %d' % i)
+        paths.append(str(path))
+
+    digests = [pipeline.source_hash(path) for path in paths]
+    assert digests == [hashlib.sha256(b'imatge %d' % i).hexdigest() for i in range(3)]
+    assert len(pipeline._hashes) == 2
+    assert [key[0] for key in pipeline._hashes] == paths[1:]
+
+
+def test_get_serves_existing_variant_without_rendering(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_derivatives, 'DERIVATIVES_DIR', str(tmp_path / 'derivatives'))
+    source = tmp_path / ('a' * 64 + '.png')
+    source.write_bytes(b'png')
+    pipeline = DerivativePipeline()
+    variant, _ = pipeline.locate(str(source), 320, 'webp')
+    (tmp_path / 'derivatives' / 'aa').mkdir(parents=True)
+    open(variant, 'wb').close()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('no s\'hauria de generar')
+
+    monkeypatch.setattr(pipeline, 'submit', fail)
+    assert asyncio.run(pipeline.get(str(source), 300, 'webp')) == (variant, 'image/webp')
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from app.api.v1.posts.repository import PostRepository
+from app.api.v1.tags.repository import TagRepository
+from app.models import PostORM
+from app.services.leaderboard import Leaderboard, bucket_of, leaderboard, utcnow
+from app.services.tag_counts import install_tag_counts
+
+
+@pytest.fixture(autouse=True)
+def fresh_leaderboard(engine):
+    install_tag_counts(engine)  # 'all' surt de tags.post_count
+    leaderboard.invalidate()
+    yield
+    leaderboard.invalidate()
+
+
+def create_post(db, title: str, tags: list) -> PostORM:
+    post = PostRepository(db).create_post(title, 'contingut', None, [{'name': name} for name in tags], None)
+    db.commit()
+    return post
+
+
+def popular(db, window: str, k: int = 10) -> list:
+    return [(tag['name'], tag['uses']) for tag in TagRepository(db).popular(k=k, window=window)]
+
+
+def test_commits_update_the_cached_ranking_without_querying(db, queries):
+    create_post(db, 'Primer post', ['python', 'fastapi'])
+    create_post(db, 'Segon post', ['python'])
+    assert popular(db, '24h') == [('python', 2), ('fastapi', 1)]
+
+    create_post(db, 'Tercer post', ['fastapi'])
+    create_post(db, 'Quart post', ['fastapi', 'python'])
+
+    queries.reset()
+    assert popular(db, '24h') == [('fastapi', 3), ('python', 3)]
+    assert queries.count == 0
+
+    # Una etiqueta que no hi era: no se'n sap el nom, es torna a calcular
+    create_post(db, 'Cinquè post', ['sqlalchemy'])
+    queries.reset()
+    assert popular(db, '24h') == [('fastapi', 3), ('python', 3), ('sqlalchemy', 1)]
+    assert queries.count == 1
+
+
+def test_deleted_posts_are_subtracted(db, queries):
+    first = create_post(db, 'Primer post', ['python', 'fastapi'])
+    create_post(db, 'Segon post', ['fastapi'])
+    assert popular(db, 'all') == [('fastapi', 2), ('python', 1)]
+
+    PostRepository(db).delete_post(first)
+    db.commit()
+
+    queries.reset()
+    assert popular(db, 'all') == [('fastapi', 1)]
+    assert queries.count == 0
+
+
+def test_ranking_matches_a_fresh_computation_under_random_writes(db, monkeypatch):
+    # Amb K petit les etiquetes de fora de la llista hi entren sovint: de tant en tant cal recalcular
+    monkeypatch.setattr(leaderboard, 'max_k', 3)
+    rng = random.Random(7)
+    names = [f'etiqueta{i}' for i in range(12)]
+    posts = []
+    for i in range(150):
+        if posts and rng.random() < 0.3:
+            PostRepository(db).delete_post(posts.pop(rng.randrange(len(posts))))
+            db.commit()
+        else:
+            posts.append(create_post(db, f'Post {i:03d}', rng.sample(names, rng.randint(1, 3))))
+        for window in ('24h', 'all'):
+            expected = Leaderboard(max_k=3)._compute(db, window, bucket_of(utcnow())).rows[:3]
+            assert TagRepository(db).popular(k=3, window=window) == expected
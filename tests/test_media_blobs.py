@@ -0,0 +1,76 @@
+import io
+import os
+
+from starlette.datastructures import Headers, UploadFile
+
+from app.services import media_blobs
+from app.services.file_storage import save_upload_file
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'imatge de prova' * 100
+
+
+def upload(data: bytes = PNG) -> dict:
+    return save_upload_file(UploadFile(io.BytesIO(data), size=len(data), filename='foto.png',
+                                       headers=Headers({'content-type': 'image/png'})))
+
+
+def test_sweep_keeps_uploads_until_released(media):
+    saved = upload()
+    path = media / saved['filename']
+
+    assert media_blobs.sweep(str(media), grace=0) == (0, 0)
+    assert path.exists()
+
+    assert media_blobs.release(saved['url'])
+    assert media_blobs.sweep(str(media), grace=0) == (1, len(PNG))
+    assert not path.exists()
+
+
+def test_each_upload_holds_its_own_reference(media):
+    first, second = upload(), upload()
+    assert first == second  # mateix contingut, un sol fitxer
+
+    media_blobs.release(first['url'])
+    media_blobs.sweep(str(media), grace=0)
+    assert (media / first['filename']).exists()
+
+    media_blobs.release(second['url'])
+    media_blobs.sweep(str(media), grace=0)
+    assert not (media / first['filename']).exists()
+    assert media_blobs.stats()['blobs'] == 0
+
+
+def test_sweep_leaves_recently_touched_files(media):
+    saved = upload()
+    media_blobs.release(saved['url'])
+    path = media / saved['filename']
+    # Una pujada idèntica acaba de tocar el fitxer: la fila i el fitxer es mantenen
+    os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 3600))
+
+    assert media_blobs.sweep(str(media), grace=0) == (0, 0)
+    assert path.exists()
+    assert media_blobs.stats()['blobs'] == 1
+
+
+def test_post_image_is_swept_once_the_post_is_deleted(media, posts_client):
+    form = {'title': 'Post amb imatge', 'content': 'Contingut del post'}
+    image = {'image': ('foto.png', PNG, 'image/png')}
+    created = posts_client.post('/posts', data=form, files=image)
+    assert created.status_code == 201
+    path = media / created.json()['image_url'].removeprefix('/media/')
+
+    # Apuntada pel post: no s'esborra
+    assert media_blobs.sweep(str(media), grace=0) == (0, 0)
+    assert posts_client.delete(f"/posts/{created.json()['id']}").status_code == 204
+
+    assert media_blobs.sweep(str(media), grace=0) == (1, len(PNG))
+    assert not path.exists()
+
+
+def test_failed_post_releases_its_image(media, posts_client):
+    form = {'title': 'Títol repetit', 'content': 'Contingut del post'}
+    assert posts_client.post('/posts', data=form).status_code == 201
+    failed = posts_client.post('/posts', data=form, files={'image': ('foto.png', PNG, 'image/png')})
+    assert failed.status_code == 409
+
+    assert media_blobs.sweep(str(media), grace=0) == (1, len(PNG))
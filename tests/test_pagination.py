@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import func, select
+
+from app.models import TagORM
+from app.services.pagination import Paginator, decode_cursor, encode_cursor
+
+TAGS = 25
+
+
+@pytest.fixture
+def paginator(db):
+    db.add_all(TagORM(name=f'etiqueta-{i:02d}', post_count=i % 5) for i in range(TAGS))
+    db.commit()
+    sortable = {'id': TagORM.id, 'name': func.lower(TagORM.name), 'post_count': TagORM.post_count}
+    return Paginator(db, TagORM, sortable)
+
+
+def test_offset_counts_then_pages(paginator, queries):
+    page = paginator.paginate(select(TagORM), strategy='offset', per_page=10, page=2, count_key='')
+    assert queries.count == 2  # count(*) + pàgina
+    assert (page.total, page.page, len(page.items), page.has_next) == (TAGS, 2, 10, True)
+
+    queries.reset()
+    paginator.paginate(select(TagORM), strategy='offset', per_page=10, page=3, count_key='')
+    assert queries.count == 1  # el total surt de la memòria cau
+
+
+def test_has_more_is_a_single_query(paginator, queries):
+    page = paginator.paginate(select(TagORM), strategy='has_more', per_page=10, page=3)
+    assert queries.count == 1
+    assert (page.total, len(page.items), page.has_next, page.has_prev) == (None, 5, False, True)
+
+
+@pytest.mark.parametrize('order_by', ['id', 'name', 'post_count'])
+def test_keyset_is_a_single_query_per_page(paginator, queries, order_by):
+    seen, cursor = [], None
+    while True:
+        queries.reset()
+        page = paginator.paginate(select(TagORM), strategy='keyset', per_page=10, order_by=order_by, cursor=cursor)
+        assert queries.count == 1
+        seen.extend(tag.id for tag in page.items)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert sorted(seen) == list(range(1, TAGS + 1))
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.parametrize('k, tie', [
+    ({'a': 1}, 1),
+    ([1, 2], 1),
+    ('etiqueta-05', [1]),
+    ('etiqueta-05', '5'),
+    ('etiqueta-05', True),
+    ('etiqueta-05', None),
+])
+def test_keyset_rejects_tampered_cursor(paginator, queries, k, tie):
+    cursor = encode_cursor({'o': 'name', 'd': 'asc', 'p': 'next', 'k': k, 'id': tie})
+    with pytest.raises(ValueError, match='Cursor invàlid'):
+        paginator.paginate(select(TagORM), strategy='keyset', order_by='name', cursor=cursor)
+    assert queries.count == 0
+
+
+def test_keyset_rejects_key_of_wrong_type(paginator):
+    cursor = encode_cursor({'o': 'post_count', 'd': 'asc', 'p': 'next', 'k': 'tres', 'id': 3})
+    with pytest.raises(ValueError, match='Cursor invàlid'):
+        paginator.paginate(select(TagORM), strategy='keyset', order_by='post_count', cursor=cursor)
+
+
+def test_cursor_round_trip():
+    values = {'o': 'id', 'd': 'desc', 'p': 'prev', 'k': 7, 'id': 7}
+    assert decode_cursor(encode_cursor(values)) == values
+    with pytest.raises(ValueError):
+        decode_cursor('no-és-base64!')
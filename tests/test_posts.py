@@ -0,0 +1,79 @@
+import pytest
+
+
+def test_duplicate_title_is_a_conflict(posts_client):
+    form = {'title': 'Títol repetit', 'content': 'Contingut del post', 'tags': ['python']}
+    assert posts_client.post('/posts', data=form).status_code == 201
+
+    response = posts_client.post('/posts', data=form)
+    assert (response.status_code, response.json()['detail']) == (409, 'Ja existeix un post amb aquest títol')
+
+
+def test_bulk_duplicates_create_no_tags(posts_client, db):
+    from sqlalchemy import select
+
+    from app.models import TagORM
+
+    assert posts_client.post('/posts', data={'title': 'Ja existeix', 'content': 'Contingut del post'}).status_code == 201
+    response = posts_client.post('/posts/bulk', json=[
+        {'title': 'Ja existeix', 'content': 'Contingut del post', 'tags': [{'name': 'orfe1'}]},
+        {'title': 'Nou post', 'content': 'Contingut del post', 'tags': [{'name': 'python'}]},
+        {'title': 'Nou post', 'content': 'Contingut del post', 'tags': [{'name': 'orfe2'}]},
+    ])
+    assert [item['status'] for item in response.json()['items']] == ['error', 'created', 'error']
+    assert db.execute(select(TagORM.name)).scalars().all() == ['python']
+
+
+def seed_posts(db, count: int) -> None:
+    from app.api.v1.posts.repository import PostRepository
+
+    PostRepository(db).bulk_create_posts(
+        [{'title': f'Post {i:03d}', 'content': 'Contingut ' * 100, 'tags': ['python', f'etiqueta{i % 3}']}
+         for i in range(count)],
+        author={'username': 'alumno', 'email': 'alumno@example.com'},
+    )
+    db.commit()
+
+
+def select_columns(statement: str) -> str:
+    return statement.split(' FROM ')[0]
+
+
+def test_post_summary_reads_only_id_and_title(posts_client, db, queries):
+    seed_posts(db, 1)
+
+    queries.reset()
+    assert posts_client.get('/posts/1?include_content=false').json() == {'id': 1, 'title': 'Post 000'}
+    assert queries.count == 1
+    assert 'content' not in select_columns(queries.statements[0])
+
+    queries.reset()
+    assert posts_client.get('/posts/1').status_code == 200
+    assert queries.count == 3  # post + etiquetes + autor
+
+
+@pytest.mark.parametrize('posts', [5, 50])
+def test_post_listing_query_count_does_not_grow_with_the_page(posts_client, db, queries, posts):
+    seed_posts(db, posts)
+
+    queries.reset()
+    assert len(posts_client.get('/posts?per_page=50&include_content=false').json()['items']) == posts
+    assert queries.count == 2  # total + pàgina
+    assert 'content' not in select_columns(queries.statements[1])
+
+    queries.reset()
+    assert len(posts_client.get('/posts?per_page=50&count=none').json()['items']) == posts
+    assert queries.count == 3  # pàgina + etiquetes + autors (selectin), sense N+1
+
+
+def test_bulk_create_query_count_does_not_grow_with_the_batch(posts_client, queries):
+    def bulk(start: int, count: int) -> int:
+        payload = [{'title': f'Post {i:04d}', 'content': 'Contingut del post', 'tags': [{'name': f'etiqueta{i % 7}'}]}
+                   for i in range(start, start + count)]
+        queries.reset()
+        response = posts_client.post('/posts/bulk', json=payload)
+        assert response.json()['created'] == count
+        return queries.count
+
+    bulk(0, 7)  # autor i etiquetes ja creats, neteja horària de tag_usage ja feta
+    assert bulk(7, 10) == bulk(17, 200) == 6  # títols, autor, etiquetes, posts, post_tags, tag_usage
@@ -0,0 +1,29 @@
+from app.core import security
+from app.core.rate_limit import client_identity
+from app.core.security import authenticate, create_access_token, token_cache
+
+
+def scope(token: str = None) -> dict:
+    headers = [(b'authorization', f'Bearer {token}'.encode())] if token else []
+    return {'type': 'http', 'headers': headers, 'client': ('10.0.0.1', 1234)}
+
+
+def test_identity_never_decodes_tokens(monkeypatch):
+    def fail(token):
+        raise AssertionError('el middleware no ha de descodificar el token')
+
+    token = create_access_token({'sub': 'alumno@example.com', 'username': 'alumno'})
+    monkeypatch.setattr(security, 'decode_token', fail)
+    assert client_identity(scope()) == 'ip:10.0.0.1'
+    # Encara no verificat (o fals): compta com la IP
+    assert client_identity(scope(token)) == 'ip:10.0.0.1'
+    assert client_identity(scope('no-és-un-jwt')) == 'ip:10.0.0.1'
+
+
+def test_identity_uses_tokens_already_verified():
+    token = create_access_token({'sub': 'alumno@example.com', 'username': 'alumno'})
+    authenticate(token)
+    stats = token_cache.stats()
+
+    assert client_identity(scope(token)) == 'user:alumno@example.com'
+    assert token_cache.stats() == stats  # no compta com a encert ni fallada de la memòria cau
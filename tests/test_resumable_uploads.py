@@ -0,0 +1,58 @@
+import base64
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1.media.router import router as media_router
+from app.api.v1.uploads.router import router as uploads_router
+from app.services import media_blobs
+from app.services.resumable_uploads import resumable_uploads
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 200
+METADATA = 'filename ' + base64.b64encode(b'foto.png').decode() + ',filetype ' + base64.b64encode(b'image/png').decode()
+CHUNK = {'Content-Type': 'application/offset+octet-stream'}
+
+
+@pytest.fixture
+def client(media):
+    app = FastAPI()
+    app.include_router(uploads_router)
+    app.include_router(media_router)
+    return TestClient(app)
+
+
+def create_session(client, length: int = len(PNG)) -> str:
+    response = client.post('/upload/sessions', headers={'Upload-Length': str(length), 'Upload-Metadata': METADATA})
+    assert response.status_code == 201
+    return response.headers['location']
+
+
+def test_resumed_upload_is_still_served_after_a_sweep(client, media):
+    location = create_session(client)
+    half = len(PNG) // 2
+    assert client.patch(location, content=PNG[:half], headers={**CHUNK, 'Upload-Offset': '0'}).status_code == 204
+    # Un offset que no toca: 409 amb el bo
+    stale = client.patch(location, content=PNG[:10], headers={**CHUNK, 'Upload-Offset': '0'})
+    assert (stale.status_code, stale.headers['upload-offset']) == (409, str(half))
+    assert client.head(location).headers['upload-offset'] == str(half)
+    assert client.patch(location, content=PNG[half:], headers={**CHUNK, 'Upload-Offset': str(half)}).status_code == 204
+
+    saved = client.post(location + '/finalize').json()
+    media_blobs.sweep(str(media), grace=0)
+
+    response = client.get(saved['url'])
+    assert response.status_code == 200
+    assert response.content == PNG
+
+
+def test_sweeper_purges_expired_sessions(client, media, monkeypatch):
+    monkeypatch.setattr(resumable_uploads, 'ttl', -1)  # caduca en crear-se
+    location = create_session(client)
+    paths = resumable_uploads._paths(location.rsplit('/', 1)[1])
+    assert all(os.path.exists(path) for path in paths)
+
+    media_blobs.sweep_once(str(media))
+
+    assert not any(os.path.exists(path) for path in paths)
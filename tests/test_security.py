@@ -0,0 +1,35 @@
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.security import authenticate, create_access_token, decode_token, token_cache
+from app.services.revocation import RevocationList, revocations
+
+
+def test_revoked_token_is_rejected_even_when_cached():
+    token = create_access_token({'sub': 'alumno@example.com', 'username': 'alumno'})
+    assert authenticate(token)['email'] == 'alumno@example.com'  # ara és a la memòria cau
+
+    revocations.add([(decode_token(token)['jti'], time.time() + 60)])
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    assert error.value.detail == 'Token revocat'
+    assert token_cache.get(token) is None
+
+
+def test_refresh_starts_a_single_long_lived_thread():
+    synced = threading.Event()
+
+    def load_rows(after_id):
+        synced.set()
+        return []
+
+    revocation_list = RevocationList(refresh_interval=0.01)
+    revocation_list.set_source(load_rows, lambda: 0)
+    before = threading.active_count()
+    for _ in range(100):
+        revocation_list.refresh()
+    assert synced.wait(5)
+    assert threading.active_count() - before == 1
@@ -0,0 +1,62 @@
+import time
+
+from app.services.tag_index import TagIndex
+
+
+def wait_for_reload(index: TagIndex) -> None:
+    deadline = time.monotonic() + 5
+    while index._reloading and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_reload_keeps_incremental_updates_made_while_reading():
+    index = TagIndex(ttl=0)
+    index.load([(1, 'python', 3), (4, 'pyramid', 2)])
+
+    def stale_rows():
+        # Mentre la recàrrega llegeix, commits d'aquest procés afegeixen, sumen i esborren etiquetes
+        index.upsert(2, 'pydantic', 1)
+        index.add_uses(1, 5)
+        index.remove(4)
+        return [(1, 'python', 3), (3, 'pytest', 7), (4, 'pyramid', 2)]
+
+    index.set_loader(stale_rows)
+    index.refresh()
+    wait_for_reload(index)
+
+    assert index.merged_tags == 3
+    assert [(tag['name'], tag['post_count']) for tag in index.suggest('py')] == [
+        ('python', 8), ('pytest', 7), ('pydantic', 1),
+    ]
+
+
+def test_reload_under_constant_writes_still_completes():
+    # Una recàrrega amb canvis concurrents també compta: no se'n llença cap altra fins al TTL
+    index = TagIndex(ttl=60)
+    calls = []
+
+    def rows():
+        calls.append(1)
+        index.add_uses(1, 1)
+        return [(1, 'python', 3)]
+
+    index.set_loader(rows)
+    index.refresh()
+    wait_for_reload(index)
+    for _ in range(10):
+        index.refresh()
+    wait_for_reload(index)
+
+    assert len(calls) == 1
+    assert index.ready
+
+
+def test_reload_applies_when_nothing_changed():
+    index = TagIndex(ttl=0)
+    index.load([(1, 'python', 3)])
+    index.set_loader(lambda: [(1, 'python', 3), (3, 'pytest', 7)])
+    index.refresh()
+    wait_for_reload(index)
+
+    assert index.merged_tags == 0
+    assert [tag['name'] for tag in index.suggest('py')] == ['pytest', 'python']